@@ -4,6 +4,8 @@ import pickle
 import pandas as pd
 import json
 from confetti.completeness import Completeness
+from confetti.completeness.schema import SUMMARY_COLUMNS, ASU_SUMMARY_COLUMNS, SUMMARY_FIELDS, \
+    SUMMARY_SIDECAR_FNAME, TABLE_FORMATS
 
 
 class Results(object):
@@ -35,38 +37,89 @@ class Results(object):
         else:
             self.table.to_csv(csv_fname)
 
+    @staticmethod
+    def find_completeness_table(workdir):
+        for table_format in TABLE_FORMATS:
+            fname = os.path.join(workdir, 'completeness.{}'.format(table_format))
+            if os.path.exists(fname):
+                return fname
+        return None
+
     def recover_completeness(self):
         if self.completeness_dir is None:
             self.logger.error('No completeness dir to parse')
             return
 
-        fname_template = os.path.join(self.completeness_dir, '{}', 'completeness_table_{}.sh')
         completeness_table = []
         for completeness_table_dir in os.listdir(self.completeness_dir):
             table_id = completeness_table_dir.replace('_p1', '').split('_')[-1]
-            completeness_table_csv = os.path.join(self.completeness_dir, completeness_table_dir, 'completeness.csv')
-            script_fname = fname_template.format(completeness_table_dir, table_id)
-            if os.path.isfile(completeness_table_csv):
-                with open(script_fname, 'r') as fhandle:
-                    for line in fhandle:
-                        if 'completeness = Completeness().from_raw_data' in line:
-                            line = line[43:].rstrip().replace("'", '"').replace('(', '[').replace(')', ']') \
-                                .replace('True', 'true').replace('False', 'false')
-                            input_args = json.loads(line)
-                            reflections_fname = input_args[1]
-                            experiments_fname = input_args[0]
-                            is_p1 = input_args[2]
-                            break
-                completeness = Completeness().from_csv(completeness_table_csv, is_p1)
-                completeness.register_raw_data(experiments_fname, reflections_fname, update_table=False)
-                completeness_table.append((self.dataset_id, table_id, *completeness.summary))
+            workdir = os.path.join(self.completeness_dir, completeness_table_dir)
+            summary = self.load_completeness_summary(workdir, table_id)
+            if summary is not None:
+                completeness_table.append((self.dataset_id, table_id, *summary))
 
         self.completeness_table = pd.DataFrame(completeness_table)
-        self.completeness_table.columns = ['DATASET', 'TABLE_ID', 'IS_P1', 'SYMMETRY_LEVEL', 'SCALED_REFL',
-                                           'SCALED_EXPT', 'KSD_r', 'KSD_phi', 'KSD_theta', 'KSD_r_prime',
-                                           'R_RFLmissing_0.3', 'R_RFLmissing_0.6', 'R_RFLmissing_0.9', 'R_VOLUME']
+        self.completeness_table.columns = ['DATASET', 'TABLE_ID', *SUMMARY_FIELDS]
         self.completeness_table.drop('DATASET', 1, inplace=True)
 
+    def load_completeness_summary(self, workdir, table_id):
+        sidecar_fname = os.path.join(workdir, SUMMARY_SIDECAR_FNAME)
+        if os.path.isfile(sidecar_fname):
+            with open(sidecar_fname, 'r') as fhandle:
+                summary = json.load(fhandle)['summary']
+            return tuple(summary[field] for field in SUMMARY_FIELDS)
+
+        completeness_table_fname = self.find_completeness_table(workdir)
+        if completeness_table_fname is None:
+            return None
+
+        self.logger.info('No summary sidecar found in {}, computing summary from table'.format(workdir))
+        script_fname = os.path.join(workdir, 'completeness_table_{}.sh'.format(table_id))
+        inputs = self.parse_completeness_script(script_fname)
+        if inputs is None:
+            self.logger.error('Unable to recover the completeness inputs from {}'.format(script_fname))
+            return None
+
+        metadata = Completeness().read_table_metadata(completeness_table_fname)
+        is_asu_weighted = metadata.get('is_asu_weighted', inputs['is_asu_weighted'])
+        columns = ASU_SUMMARY_COLUMNS if is_asu_weighted else SUMMARY_COLUMNS
+        completeness = Completeness().from_table_file(completeness_table_fname, inputs['is_p1'], is_asu_weighted,
+                                                      columns=columns)
+        completeness.reflections_fname = inputs['reflections_fname']
+        completeness.experiments_fname = inputs['experiments_fname']
+        return completeness.summary
+
+    @staticmethod
+    def parse_completeness_script(script_fname):
+        """Recover the input files and flags written by :py:attr:`Completeness.python_script` into a job script"""
+        if not os.path.isfile(script_fname):
+            return None
+        inputs = {}
+        with open(script_fname, 'r') as fhandle:
+            for line in fhandle:
+                if 'completeness = Completeness().from_' in line:
+                    from_mtz = 'from_mtz' in line
+                    line = line[line.index('(', line.index('.from_')):].rstrip()
+                    line = line.replace("'", '"').replace('(', '[').replace(')', ']').replace('True', 'true') \
+                        .replace('False', 'false').replace('None', 'null')
+                    input_args = json.loads(line)
+                    if from_mtz:
+                        input_args = input_args[1:]
+                    else:
+                        inputs['experiments_fname'], inputs['reflections_fname'] = input_args[:2]
+                        input_args = input_args[2:]
+                    inputs['is_p1'] = input_args[0] if len(input_args) > 0 else True
+                    inputs['is_asu_weighted'] = input_args[1] if len(input_args) > 1 else False
+                elif line.startswith('completeness.experiments_fname = '):
+                    inputs['experiments_fname'] = line.split('=', 1)[1].strip().strip("'")
+                elif line.startswith('completeness.reflections_fname = '):
+                    inputs['reflections_fname'] = line.split('=', 1)[1].strip().strip("'")
+        if 'is_p1' not in inputs:
+            return None
+        inputs.setdefault('experiments_fname', None)
+        inputs.setdefault('reflections_fname', None)
+        return inputs
+
     def recover_clusters(self):
         if self.clusterarray_pickle is None:
             self.logger.error('No cluster array pickle to load')
@@ -89,7 +142,8 @@ class Results(object):
                                       'DELTA_CCHALF_MEAN', 'CCHALF_STD', 'SCALE_N_DELETED_DATASETS', 'RPIM', 'RMEAS',
                                       'RMERGE', 'CCHALF', 'I/SIGMA', 'MULTIPLICITY', 'COMPLETENESS', 'RESOLUTION_LOW',
                                       'RESOLUTION_HIGH', 'COMPLETENESS_LOW', 'COMPLETENESS_HIGH', 'SPACE_GROUP',
-                                      'CONNECTED_REFLECTIONS', 'EXPT_IDS', 'SWEEPS']
+                                      'CONNECTED_REFLECTIONS', 'PREDICTED_COMPLETENESS', 'EXPT_IDS',
+                                      'SWEEPS']
         self.cluster_table.reset_index(drop=True, inplace=True)
 
     def recover_mr_results(self):
@@ -10,3 +10,24 @@ def CompletenessArray(*args, **kwargs):
     from confetti.completeness.completenessarray import CompletenessArray
 
     return CompletenessArray(*args, **kwargs)
+
+
+def AblationSeries(*args, **kwargs):
+    """:py:obj:`~confetti.completeness.ablation.AblationSeries` instance"""
+    from confetti.completeness.ablation import AblationSeries
+
+    return AblationSeries(*args, **kwargs)
+
+
+def MonteCarloIncompleteness(*args, **kwargs):
+    """:py:obj:`~confetti.completeness.montecarlo.MonteCarloIncompleteness` instance"""
+    from confetti.completeness.montecarlo import MonteCarloIncompleteness
+
+    return MonteCarloIncompleteness(*args, **kwargs)
+
+
+def CompletenessPredictor(*args, **kwargs):
+    """:py:obj:`~confetti.completeness.prediction.CompletenessPredictor` instance"""
+    from confetti.completeness.prediction import CompletenessPredictor
+
+    return CompletenessPredictor(*args, **kwargs)
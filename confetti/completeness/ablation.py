@@ -0,0 +1,94 @@
+import logging
+import numpy as np
+from scipy.stats import gaussian_kde
+from confetti.completeness.kde import gaussian_kernel_sum
+
+
+class AblationSeries(object):
+    """Incremental re-analysis of a :py:obj:`~confetti.completeness.completeness.Completeness` table across a series
+    of reflection removals
+
+    The kernel covariances of the observed and missing weighted densities are frozen when the series is created, so
+    after each ``remove_*`` call only the kernel contributions of the reflections that changed OBSERVED are subtracted
+    from or added to the existing densities. KS statistics are taken from the pre-sorted distributions cached in the
+    completeness instance and MeanShift is warm-started from the cluster centres of the previous step, plus bin seeds
+    of the newly missing reflections. Because the bandwidths are not refitted, densities slowly drift from a full
+    recomputation as the observed and missing sets change their spread. ASU weighted tables are not supported, since
+    their densities are fitted on the P1 expansion of the table rather than on the rows themselves.
+    """
+
+    def __init__(self, completeness, weight='RES_CUMSUM', bandwidth=0.05, njobs=1, threshold_quantile=0.75,
+                 block_size=2048):
+        if completeness.is_asu_weighted:
+            raise ValueError('Ablation series cannot be run on ASU weighted tables, use a P1 expanded table instead')
+        self.completeness = completeness
+        self.weight = weight
+        self.bandwidth = bandwidth
+        self.njobs = njobs
+        self.threshold_quantile = threshold_quantile
+        self.block_size = block_size
+        self.logger = logging.getLogger(__name__)
+
+        if 'WEIGHTED_DENSITY' not in self.table.columns:
+            self.completeness.get_missing_observed_density_abc_weighted(weight)
+        if 'MEANSHIFT_LABELS' not in self.table.columns or self.completeness.meanshift_centers is None:
+            self.completeness.get_meanshift_labels(bandwidth, njobs, threshold_quantile)
+
+        self.points = self.table[['A', 'B', 'C']].values.astype(float)
+        self.weights = self.table[weight].values.astype(float)
+        self.observed = self.table['OBSERVED'].values.astype(bool)
+        self.covariance = {}
+        self.total_weight = {}
+        for is_observed in (True, False):
+            members = self.observed == is_observed
+            kde = gaussian_kde(self.points[members].T, weights=self.weights[members])
+            self.covariance[is_observed] = kde.covariance
+            self.total_weight[is_observed] = self.weights[members].sum()
+        density = self.table['WEIGHTED_DENSITY'].values.astype(float)
+        self.kernel_sum = density * np.where(self.observed, self.total_weight[True], self.total_weight[False])
+
+    # ------------------ Properties ------------------
+
+    @property
+    def table(self):
+        return self.completeness.table
+
+    # ------------------ Methods ------------------
+
+    def update_set(self, is_observed, members_before, members_after):
+        removed = members_before & ~members_after
+        added = ~members_before & members_after
+        stayed = members_before & members_after
+        covariance = self.covariance[is_observed]
+
+        changes = self.weights.copy()
+        changes[removed] *= -1
+        changed = removed | added
+        self.kernel_sum[stayed] += gaussian_kernel_sum(self.points[stayed], self.points[changed], changes[changed],
+                                                       covariance, self.block_size)
+        self.kernel_sum[added] = gaussian_kernel_sum(self.points[added], self.points[members_after],
+                                                     self.weights[members_after], covariance, self.block_size)
+        self.total_weight[is_observed] += self.weights[added].sum() - self.weights[removed].sum()
+
+    def update(self):
+        """Update densities, MeanShift labels and summary after OBSERVED changed, returns the new summary"""
+        observed = self.table['OBSERVED'].values.astype(bool)
+        newly_missing = self.observed & ~observed
+        self.logger.info('Updating densities for {} reflections that changed'.format(
+            np.count_nonzero(observed != self.observed)))
+
+        self.update_set(True, self.observed, observed)
+        self.update_set(False, ~self.observed, ~observed)
+        self.observed = observed
+
+        density = self.kernel_sum / np.where(observed, self.total_weight[True], self.total_weight[False])
+        self.table['WEIGHTED_DENSITY'] = density
+        self.table['NORM_WEIGHTED_DENSITY'] = (density - density.min()) / (density.max() - density.min())
+
+        seeds = self.completeness.meanshift_centers
+        if np.any(newly_missing):
+            new_seeds = np.unique(np.round(self.points[newly_missing] / self.bandwidth), axis=0) * self.bandwidth
+            seeds = np.vstack((seeds, new_seeds))
+        self.completeness.get_meanshift_labels(self.bandwidth, self.njobs, self.threshold_quantile, seeds=seeds)
+
+        return self.completeness.summary
@@ -0,0 +1,83 @@
+import os
+import json
+import hashlib
+import logging
+import numpy as np
+from confetti.completeness.hkl import miller_index_array
+
+
+class CompleteSetCache(object):
+    """On-disk cache of complete set Miller indices shared by the completeness tables of the same crystal form
+
+    Entries are keyed by space group, unit cell rounded to ``cell_decimals`` and d_min rounded down to a multiple of
+    ``d_min_step``, together with the P1 and ASU flags. Each entry is generated with the unit cell of the first table
+    that needs it at ``(1 - d_min_margin)`` times the rounded d_min, so it is a superset of the complete set of every
+    table sharing the key. Tables must then recompute d-spacings and reciprocal coordinates from their own unit cell
+    and apply their exact d_min. Entries are written to a temporary file and renamed, so concurrent jobs never read a
+    partial file.
+    """
+
+    def __init__(self, cache_dir, cell_decimals=1, d_min_step=0.05, d_min_margin=0.02):
+        self.cache_dir = cache_dir
+        self.cell_decimals = cell_decimals
+        self.d_min_step = d_min_step
+        self.d_min_margin = d_min_margin
+        self.logger = logging.getLogger(__name__)
+
+    # ------------------ Methods ------------------
+
+    def get_d_min_key(self, d_min):
+        return round(np.floor(d_min / self.d_min_step) * self.d_min_step, 6)
+
+    def get_key(self, space_group, unit_cell, d_min, expand_to_p1, asu_weighted):
+        return {'space_group': space_group.type().hall_symbol(),
+                'unit_cell': [round(parameter, self.cell_decimals) for parameter in unit_cell.parameters()],
+                'd_min': self.get_d_min_key(d_min), 'expand_to_p1': bool(expand_to_p1),
+                'asu_weighted': bool(asu_weighted)}
+
+    def get_fname(self, key):
+        digest = hashlib.sha1(json.dumps(key, sort_keys=True).encode()).hexdigest()[:16]
+        return os.path.join(self.cache_dir, 'complete_set_{}.npz'.format(digest))
+
+    def load(self, key):
+        fname = self.get_fname(key)
+        if not os.path.isfile(fname):
+            return None
+        with np.load(fname, allow_pickle=False) as cached:
+            if json.loads(str(cached['key'])) != key:
+                return None
+            return {name: cached[name] for name in cached.files if name != 'key'}
+
+    def save(self, key, arrays):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fname = self.get_fname(key)
+        tmp_fname = '{}.{}.tmp'.format(fname, os.getpid())
+        with open(tmp_fname, 'wb') as fhandle:
+            np.savez(fhandle, key=json.dumps(key, sort_keys=True), **arrays)
+        os.replace(tmp_fname, fname)
+
+    def get_complete_set(self, observed_set, expand_to_p1=True, asu_weighted=False):
+        """Return the cached complete set arrays for an observed set, generating them on a miss
+
+        The returned dictionary holds the ``hkl`` indices and, with ``asu_weighted``, the ``multiplicity`` and
+        ``centric`` arrays.
+        """
+        key = self.get_key(observed_set.space_group(), observed_set.unit_cell(), observed_set.d_min(), expand_to_p1,
+                           asu_weighted)
+        arrays = self.load(key)
+        if arrays is not None:
+            self.logger.info('Complete set found in cache {}'.format(self.get_fname(key)))
+            return arrays
+
+        from cctbx import miller
+        complete_set = miller.build_set(observed_set, observed_set.anomalous_flag(),
+                                        d_min=key['d_min'] * (1 - self.d_min_margin))
+        if expand_to_p1:
+            complete_set = complete_set.expand_to_p1()
+        arrays = {'hkl': miller_index_array(complete_set.indices())}
+        if asu_weighted:
+            arrays['multiplicity'] = complete_set.multiplicities().data().as_numpy_array()
+            arrays['centric'] = complete_set.centric_flags().data().as_numpy_array()
+        self.save(key, arrays)
+        self.logger.info('Complete set written to cache {}'.format(self.get_fname(key)))
+        return arrays
@@ -0,0 +1,41 @@
+import numpy as np
+from sklearn.cluster import MeanShift, DBSCAN
+
+CLUSTERING_BACKENDS = ('meanshift', 'meanshift_binned', 'dbscan', 'hdbscan')
+
+
+def get_cluster_centers(points, labels):
+    """Mean position of the points of each cluster, noise points (label -1) are ignored"""
+    clustered = labels >= 0
+    if not np.any(clustered):
+        return np.zeros((0, points.shape[1]))
+    counts = np.bincount(labels[clustered])
+    centers = np.stack([np.bincount(labels[clustered], weights=points[clustered, dim]) for dim in
+                        range(points.shape[1])], axis=1)
+    return centers / counts[:, None]
+
+
+def cluster_points(points, backend='meanshift', bandwidth=0.05, njobs=1, seeds=None, min_samples=5):
+    """Cluster a (N, 3) array of points and return the labels, with -1 for noise, and the cluster centres
+
+    - ``meanshift``: :py:obj:`sklearn.cluster.MeanShift` seeded at every point, or at ``seeds`` if given
+    - ``meanshift_binned``: MeanShift seeded at the occupied bins of a grid with spacing ``bandwidth``
+    - ``dbscan``: :py:obj:`sklearn.cluster.DBSCAN` with ``eps=bandwidth`` using a KD-tree for neighbour queries
+    - ``hdbscan``: :py:obj:`sklearn.cluster.HDBSCAN` with ``min_cluster_size=min_samples`` using a KD-tree
+    """
+    points = np.asarray(points, dtype=float)
+    if backend == 'meanshift':
+        clustering = MeanShift(bandwidth=bandwidth, n_jobs=njobs, seeds=seeds).fit(points)
+        return clustering.labels_, clustering.cluster_centers_
+    elif backend == 'meanshift_binned':
+        clustering = MeanShift(bandwidth=bandwidth, n_jobs=njobs, seeds=seeds, bin_seeding=seeds is None).fit(points)
+        return clustering.labels_, clustering.cluster_centers_
+    elif backend == 'dbscan':
+        clustering = DBSCAN(eps=bandwidth, min_samples=min_samples, algorithm='kd_tree', n_jobs=njobs).fit(points)
+    elif backend == 'hdbscan':
+        from sklearn.cluster import HDBSCAN
+        clustering = HDBSCAN(min_cluster_size=min_samples, algorithm='kd_tree', n_jobs=njobs).fit(points)
+    else:
+        raise ValueError('Unknown clustering backend {}, use one of {}'.format(backend, CLUSTERING_BACKENDS))
+
+    return clustering.labels_, get_cluster_centers(points, clustering.labels_)
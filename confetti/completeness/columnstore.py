@@ -0,0 +1,130 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+
+MANIFEST_FNAME = 'manifest.json'
+COLUMN_STORE_VERSION = 1
+
+
+def write_column_store(df, dirname):
+    """Write each column of a table as a .npy file inside a directory, together with a json manifest
+
+    Categorical columns are stored as their integer codes and the categories are kept in the manifest. The manifest
+    is written last, so a directory without it holds an incomplete store.
+    """
+    os.makedirs(dirname, exist_ok=True)
+    manifest_fname = os.path.join(dirname, MANIFEST_FNAME)
+    if os.path.isfile(manifest_fname):
+        os.remove(manifest_fname)
+
+    manifest = {'version': COLUMN_STORE_VERSION, 'nrows': int(df.shape[0]), 'columns': []}
+    for idx, column in enumerate(df.columns):
+        entry = {'name': column, 'fname': 'column_{:04d}.npy'.format(idx)}
+        values = df[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            entry['categories'] = values.cat.categories.tolist()
+            values = values.cat.codes
+        values = values.to_numpy()
+        if values.dtype == object:
+            raise ValueError('Cannot store column {} with dtype object'.format(column))
+        np.save(os.path.join(dirname, entry['fname']), values, allow_pickle=False)
+        manifest['columns'].append(entry)
+
+    with open(manifest_fname, 'w') as fhandle:
+        json.dump(manifest, fhandle)
+
+
+def read_column_store(dirname, columns=None, mmap_mode='r'):
+    """Open a directory created with :py:func:`write_column_store` as a table backed by memory-mapped arrays
+
+    With the default ``mmap_mode='r'`` no column is read or copied until it is accessed and the arrays are read-only,
+    so the returned table can be used to compute statistics but not modified in place. Statistics still read every
+    column they use in full, so the savings come from the columns that are never accessed.
+    """
+    with open(os.path.join(dirname, MANIFEST_FNAME), 'r') as fhandle:
+        manifest = json.load(fhandle)
+
+    data = {}
+    for entry in manifest['columns']:
+        if columns is not None and entry['name'] not in columns:
+            continue
+        values = np.load(os.path.join(dirname, entry['fname']), mmap_mode=mmap_mode, allow_pickle=False)
+        if 'categories' in entry:
+            values = pd.Categorical.from_codes(values, entry['categories'])
+        data[entry['name']] = values
+
+    return pd.DataFrame(data, copy=False)
+
+
+class ColumnStoreWriter(object):
+    """Incremental writer of a column store for tables generated one chunk at a time
+
+    Every call to :py:func:`append` writes the chunk columns into temporary .npy files. On :py:func:`close`, the
+    chunks of each column are copied one at a time into a single memory-mapped .npy file and the manifest is
+    written, so the result can be opened with :py:func:`read_column_store` and peak memory while writing is bounded
+    by the size of a chunk.
+    """
+
+    def __init__(self, dirname):
+        self.dirname = dirname
+        self.columns = None
+        self.chunks = []
+        os.makedirs(dirname, exist_ok=True)
+        manifest_fname = os.path.join(dirname, MANIFEST_FNAME)
+        if os.path.isfile(manifest_fname):
+            os.remove(manifest_fname)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+
+    @property
+    def nrows(self):
+        return sum(nrows for nrows, dtypes in self.chunks)
+
+    def get_chunk_fname(self, column_idx, chunk_idx):
+        return os.path.join(self.dirname, 'column_{:04d}.chunk_{:04d}.npy'.format(column_idx, chunk_idx))
+
+    def append(self, df):
+        if self.columns is None:
+            self.columns = list(df.columns)
+        elif list(df.columns) != self.columns:
+            raise ValueError('Chunk columns {} do not match store columns {}'.format(list(df.columns), self.columns))
+
+        chunk_idx = len(self.chunks)
+        dtypes = []
+        for column_idx, column in enumerate(self.columns):
+            values = df[column].to_numpy()
+            if values.dtype == object:
+                raise ValueError('Cannot store column {} with dtype object'.format(column))
+            np.save(self.get_chunk_fname(column_idx, chunk_idx), values, allow_pickle=False)
+            dtypes.append(values.dtype)
+        self.chunks.append((df.shape[0], dtypes))
+
+    def close(self):
+        if self.columns is None:
+            raise ValueError('No chunks were appended to the column store')
+
+        nrows = self.nrows
+        manifest = {'version': COLUMN_STORE_VERSION, 'nrows': nrows, 'columns': []}
+        for column_idx, column in enumerate(self.columns):
+            entry = {'name': column, 'fname': 'column_{:04d}.npy'.format(column_idx)}
+            dtype = np.result_type(*[dtypes[column_idx] for chunk_nrows, dtypes in self.chunks])
+            values = np.lib.format.open_memmap(os.path.join(self.dirname, entry['fname']), mode='w+', dtype=dtype,
+                                               shape=(nrows,))
+            start = 0
+            for chunk_idx, (chunk_nrows, dtypes) in enumerate(self.chunks):
+                chunk_fname = self.get_chunk_fname(column_idx, chunk_idx)
+                values[start:start + chunk_nrows] = np.load(chunk_fname, mmap_mode='r')
+                start += chunk_nrows
+                os.remove(chunk_fname)
+            values.flush()
+            del values
+            manifest['columns'].append(entry)
+
+        with open(os.path.join(self.dirname, MANIFEST_FNAME), 'w') as fhandle:
+            json.dump(manifest, fhandle)
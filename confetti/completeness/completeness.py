@@ -1,62 +1,177 @@
+import os
+import json
+import importlib.util
 import pandas as pd
 import numpy as np
 import pyjob
+import time
 import logging
-from scipy.stats import gaussian_kde, ks_2samp
+from concurrent.futures import ThreadPoolExecutor
+from cached_property import cached_property
 from scipy.spatial import ConvexHull
 from scipy.spatial.qhull import QhullError
-from sklearn.cluster import MeanShift
-from cctbx import miller, array_family
-from confetti.io.reflections_parser import Reflections
-from confetti.io.experiments_parser import Experiments
+from sklearn.metrics import adjusted_rand_score
+from confetti.completeness.kde import get_kde_engine, get_multiplicity_bw_method
+from confetti.completeness.clustering import cluster_points
+from confetti.completeness.symmetry import SymmetryExpander
+from confetti.completeness.geometry import RotationGeometry, count_sampled_equivalents
+from confetti.completeness.cache import CompleteSetCache
+from confetti.completeness.schema import apply_compact_schema, TABLE_FORMATS, SUMMARY_FIELDS, TABLE_METADATA_SUFFIX
+from confetti.completeness.columnstore import write_column_store, read_column_store, ColumnStoreWriter
+from confetti.completeness.hkl import pack_hkl, pack_hkl_array, unpack_hkl, miller_index_keys, flex_miller_index, \
+    isin_keys
 
 
 class Completeness(object):
 
     def __init__(self):
         self.is_p1 = False
+        self.is_asu_weighted = False
+        self.space_group_hall = None
+        self.fractionalization_matrix = None
         self.table = None
         self.reflections = None
         self.experiments = None
         self.reflections_fname = None
         self.experiments_fname = None
-        self.csv_out_fname = None
+        self.table_out_fname = None
+        self.summary_out_fname = None
+        self.store_dirname = None
+        self.nshells = 16
+        self.cache_dir = None
+        self.mtz_fname = None
+        self.python_exe = None
+        self.volume_method = 'hull'
+        self.voxel_size = None
         self.dials_exe = 'dials'
+        self.density_mode = 'exact'
+        self.res_density_mode = 'exact'
         self.workdir = None
         self.id = None
+        self._summary_statistics = None
+        self._total_volume = {}
+        self._hkl_key_sorter = None
+        self._sort_orders = {}
+        self._reciprocal_matrix = None
+        self.meanshift_centers = None
         self.logger = logging.getLogger(__name__)
 
+    def __setstate__(self, state):
+        """Restore pickles from earlier versions, filling attributes they lack with their defaults"""
+        if 'csv_out_fname' in state:
+            state['table_out_fname'] = state.pop('csv_out_fname')
+        state.pop('table_format', None)
+        self.__init__()
+        self.__dict__.update(state)
+
     # ------------------ Class methods ------------------
 
     @classmethod
-    def from_raw_data(cls, experiments_fname, reflections_fname, expand_to_p1=True):
+    def from_raw_data(cls, experiments_fname, reflections_fname, expand_to_p1=True, asu_weighted=False,
+                      store_dirname=None, nshells=16, cache_dir=None):
         dataset = cls()
         dataset.register_raw_data(experiments_fname, reflections_fname)
-        dataset.get_reflection_table(expand_to_p1)
+        if store_dirname is not None:
+            dataset.stream_reflection_table(store_dirname, expand_to_p1, asu_weighted, nshells)
+        else:
+            dataset.get_reflection_table(expand_to_p1, asu_weighted, cache_dir=cache_dir)
+        return dataset
+
+    @classmethod
+    def from_mtz(cls, mtz_fname, expand_to_p1=True, asu_weighted=False, compact=False):
+        """Create the reflection table from the observed indices, cell and space group of a merged MTZ file using
+        gemmi, without loading DIALS reflections and experiments"""
+        import gemmi
+
+        dataset = cls()
+        dataset.mtz_fname = mtz_fname
+        mtz = gemmi.read_mtz_file(mtz_fname)
+        dataset.symmetry_expander = SymmetryExpander.from_gemmi_ops(mtz.spacegroup.operations())
+        dataset.logger.info('Creating reflection table from {}'.format(mtz_fname))
+        df = dataset.compute_df_from_mtz(mtz, dataset.symmetry_expander, expand_to_p1, asu_weighted)
+        r, theta, phi = dataset.compute_spherical_coords(df)
+        df['r'] = r
+        df['phi'] = phi
+        df['theta'] = theta
+        dataset.table = df
+        if compact:
+            dataset.compact_table()
+        dataset.is_p1 = expand_to_p1 and not asu_weighted
+        dataset.is_asu_weighted = asu_weighted
+        dataset.space_group_hall = mtz.spacegroup.hall
+        dataset.fractionalization_matrix = np.array(mtz.cell.fractionalization_matrix.tolist())
+        dataset.invalidate_cache(table_changed=True)
         return dataset
 
     @classmethod
-    def from_csv(cls, csv_fname, is_p1=True):
+    def from_csv(cls, csv_fname, is_p1=True, is_asu_weighted=False, space_group_hall=None, compact=False,
+                 columns=None):
+        return cls.from_table_file(csv_fname, is_p1, is_asu_weighted, space_group_hall, compact, columns)
+
+    @classmethod
+    def from_parquet(cls, parquet_fname, is_p1=True, is_asu_weighted=False, space_group_hall=None, compact=False,
+                     columns=None):
+        return cls.from_table_file(parquet_fname, is_p1, is_asu_weighted, space_group_hall, compact, columns)
+
+    @classmethod
+    def from_column_store(cls, dirname, is_p1=True, is_asu_weighted=False, space_group_hall=None, columns=None):
+        """Open a per-column .npy store as a read-only table of memory-mapped arrays"""
+        return cls.from_table_file(dirname, is_p1, is_asu_weighted, space_group_hall, columns=columns)
+
+    @classmethod
+    def from_table_file(cls, fname, is_p1=True, is_asu_weighted=False, space_group_hall=None, compact=False,
+                        columns=None):
+        """Load a table written with :py:func:`save_table`, optionally reading only a subset of its columns
+
+        The space group and unit cell are taken from the metadata file written next to the table, if any. An explicit
+        ``space_group_hall`` takes precedence over the metadata.
+        """
         dataset = cls()
-        dataset.table = pd.read_csv(csv_fname)
+        metadata = cls.read_table_metadata(fname)
+        dataset.table = cls.read_table(fname, columns)
         if 'Unnamed: 0' in dataset.table.columns:
             dataset.table.drop('Unnamed: 0', 1, inplace=True)
-        dataset.is_p1 = is_p1
+        if compact:
+            dataset.compact_table()
+        dataset.is_p1 = is_p1 and not is_asu_weighted
+        dataset.is_asu_weighted = is_asu_weighted
+        dataset.space_group_hall = space_group_hall if space_group_hall is not None else \
+            metadata.get('space_group_hall')
+        if metadata.get('fractionalization_matrix') is not None:
+            dataset.fractionalization_matrix = np.array(metadata['fractionalization_matrix'])
         return dataset
 
     # ------------------ Properties ------------------
 
     @property
     def python_script(self):
-        return """{dials_exe}.python << EOF
+        stream_args = ''
+        if self.store_dirname is not None or self.cache_dir is not None:
+            stream_args = ', {!r}, {}, {!r}'.format(self.store_dirname, self.nshells, self.cache_dir)
+        summary_line = ''
+        if self.summary_out_fname is not None:
+            summary_line = "completeness.write_summary('{}')\n".format(self.summary_out_fname)
+        interpreter = self.python_exe if self.python_exe is not None else '{}.python'.format(self.dials_exe)
+        if self.mtz_fname is not None:
+            if self.store_dirname is not None or self.cache_dir is not None:
+                raise ValueError('Tables created from {} cannot be streamed by shells or use the complete set '
+                                 'cache'.format(self.mtz_fname))
+            load_lines = """completeness = Completeness().from_mtz('{mtz_fname}', {is_p1}, {is_asu_weighted})
+completeness.experiments_fname = '{experiments_fname}'
+completeness.reflections_fname = '{reflections_fname}'""".format(**self.__dict__)
+        else:
+            load_lines = "completeness = Completeness().from_raw_data('{experiments_fname}', '{reflections_fname}', " \
+                         "{is_p1}, {is_asu_weighted}{stream_args})".format(stream_args=stream_args, **self.__dict__)
+        return """{interpreter} << EOF
 from confetti.completeness import Completeness
-completeness = Completeness().from_raw_data('{experiments_fname}', '{reflections_fname}', {is_p1})
-completeness.get_res_density()
-completeness.get_missing_observed_density_abc_weighted('RES_CUMSUM')
+{load_lines}
+completeness.get_res_density('{res_density_mode}')
+completeness.get_missing_observed_density_abc_weighted('RES_CUMSUM', '{density_mode}')
 completeness.get_meanshift_labels()
 completeness.get_unique_reflections()
-completeness.table.to_csv('{csv_out_fname}')
-EOF""".format(**self.__dict__)
+completeness.save_table('{table_out_fname}')
+{summary_line}EOF""".format(interpreter=interpreter, load_lines=load_lines, summary_line=summary_line,
+                               **self.__dict__)
 
     @property
     def script(self):
@@ -83,45 +198,162 @@ EOF""".format(**self.__dict__)
 
     @property
     def ksd_r(self):
-        ks = ks_2samp(self.table.r, self.table.loc[self.table.OBSERVED].r)
-        return ks.statistic
+        return self.summary_statistics['ksd_r']
 
     @property
     def ksd_r_prime(self):
-        ks = ks_2samp(np.cumsum(self.table['RES'].sort_values(ascending=True)),
-                      np.cumsum(self.table.loc[(self.table.OBSERVED)]['RES'].sort_values(ascending=True)))
-        return ks.statistic
+        return self.summary_statistics['ksd_r_prime']
 
     @property
     def ksd_theta(self):
-        ks = ks_2samp(self.table.theta, self.table.loc[self.table.OBSERVED].theta)
-        return ks.statistic
+        return self.summary_statistics['ksd_theta']
 
     @property
     def ksd_phi(self):
-        ks = ks_2samp(self.table.phi, self.table.loc[self.table.OBSERVED].phi)
-        return ks.statistic
+        return self.summary_statistics['ksd_phi']
+
+    @property
+    def summary_statistics(self):
+        if self._summary_statistics is None:
+            self._summary_statistics = self.compute_summary_statistics()
+        return self._summary_statistics
+
+    @cached_property
+    def symmetry_expander(self):
+        if self.space_group_hall is not None:
+            try:
+                from cctbx import sgtbx
+            except ImportError:
+                import gemmi
+                return SymmetryExpander.from_gemmi_ops(gemmi.symops_from_hall(self.space_group_hall))
+            return SymmetryExpander.from_space_group(sgtbx.space_group(self.space_group_hall))
+        if self.experiments is None:
+            from confetti.io.experiments_parser import Experiments
+            self.logger.warning('No space group stored with the table, loading {}'.format(self.experiments_fname))
+            self.experiments = Experiments(self.experiments_fname)
+        return SymmetryExpander.from_space_group(self.experiments.data[0].crystal.get_space_group())
+
+    @property
+    def reciprocal_matrix(self):
+        """Matrix M such that [A, B, C] = [H, K, L] * M
+
+        This is the fractionalization matrix of the unit cell the table was created with. Tables saved without
+        metadata fall back to a least squares fit of the table itself.
+        """
+        if self.fractionalization_matrix is not None:
+            return self.fractionalization_matrix
+        if self._reciprocal_matrix is None:
+            self.logger.warning('No unit cell available, fitting the reciprocal basis to the table coordinates')
+            hkl = self.table[['H', 'K', 'L']].values.astype(float)
+            abc = self.table[['A', 'B', 'C']].values.astype(float)
+            self._reciprocal_matrix = np.linalg.lstsq(hkl, abc, rcond=None)[0]
+        return self._reciprocal_matrix
+
+    @property
+    def multiplicity(self):
+        if self.is_asu_weighted:
+            return self.table['MULTIPLICITY'].values.astype(np.int64)
+        return np.ones(self.table.shape[0], dtype=np.int64)
 
     @property
     def symmetry_level(self):
         if self.table is None or 'IS_UNIQUE' not in self.table.columns:
             return None
-        return self.table.shape[0] / self.table.loc[self.table.IS_UNIQUE].shape[0]
+        return self.multiplicity.sum() / self.table.loc[self.table.IS_UNIQUE].shape[0]
 
     @property
     def summary(self):
-        return (self.is_p1, self.symmetry_level, self.reflections_fname, self.experiments_fname, self.ksd_r,
-                self.ksd_phi, self.ksd_theta, self.ksd_r_prime, self.get_ratio_high_density_reflections(),
-                self.get_ratio_high_density_reflections(0.6), self.get_ratio_high_density_reflections(0.9),
-                self.get_volume_ratio())
+        statistics = self.summary_statistics
+        return (self.is_p1, self.symmetry_level, self.reflections_fname, self.experiments_fname, statistics['ksd_r'],
+                statistics['ksd_phi'], statistics['ksd_theta'], statistics['ksd_r_prime'],
+                statistics['high_density_0.3'], statistics['high_density_0.6'], statistics['high_density_0.9'],
+                statistics['volume_ratio'])
+
+    @property
+    def summary_dict(self):
+        return {field: value.item() if isinstance(value, np.generic) else value
+                for field, value in zip(SUMMARY_FIELDS, self.summary)}
+
+    @property
+    def default_voxel_size(self):
+        """Smallest voxel edge that guarantees a reciprocal lattice point in every voxel of a fully sampled region"""
+        return np.abs(self.reciprocal_matrix).sum(axis=0).max()
 
     # ------------------ Static methods ------------------
 
     @staticmethod
-    def get_density(values):
-        kde = gaussian_kde(values)
+    def get_table_format(fname):
+        table_format = fname.rstrip(os.sep).rsplit('.', 1)[-1].lower()
+        if table_format not in TABLE_FORMATS:
+            raise ValueError('Unknown table format {}, use one of {}'.format(table_format, TABLE_FORMATS))
+        if table_format in ('parquet', 'feather') and importlib.util.find_spec('pyarrow') is None:
+            raise ImportError('The optional dependency pyarrow is required for {} tables, install it or use the '
+                              'csv or npy table formats'.format(table_format))
+        return table_format
+
+    @staticmethod
+    def get_metadata_fname(fname):
+        return '{}{}'.format(fname.rstrip(os.sep), TABLE_METADATA_SUFFIX)
+
+    @staticmethod
+    def read_table_metadata(fname):
+        metadata_fname = Completeness.get_metadata_fname(fname)
+        if not os.path.isfile(metadata_fname):
+            return {}
+        with open(metadata_fname, 'r') as fhandle:
+            return json.load(fhandle)
+
+    @staticmethod
+    def write_json(data, fname):
+        """Write a json file through a temporary file, so readers never find it partially written"""
+        tmp_fname = '{}.tmp'.format(fname)
+        with open(tmp_fname, 'w') as fhandle:
+            json.dump(data, fhandle, indent=2)
+        os.replace(tmp_fname, fname)
+
+    @staticmethod
+    def get_fractionalization_matrix(unit_cell):
+        return np.array(unit_cell.fractionalization_matrix()).reshape(3, 3)
+
+    @staticmethod
+    def read_table(fname, columns=None):
+        table_format = Completeness.get_table_format(fname)
+        if table_format == 'parquet':
+            return pd.read_parquet(fname, columns=columns)
+        elif table_format == 'feather':
+            return pd.read_feather(fname, columns=columns)
+        elif table_format == 'npy':
+            return read_column_store(fname, columns)
+        elif columns is not None:
+            return pd.read_csv(fname, usecols=lambda column: column in columns)
+        return pd.read_csv(fname)
+
+    @staticmethod
+    def get_density(values, mode='exact', **kwargs):
+        kde = get_kde_engine(mode)(values, **kwargs)
         return kde(values)
 
+    @staticmethod
+    def get_ks_statistic(sorted_a, sorted_b):
+        values = np.concatenate((sorted_a, sorted_b))
+        cdf_a = np.searchsorted(sorted_a, values, side='right') / sorted_a.size
+        cdf_b = np.searchsorted(sorted_b, values, side='right') / sorted_b.size
+        return np.max(np.abs(cdf_a - cdf_b))
+
+    @staticmethod
+    def get_ks_statistic_masked(sorted_values, sorted_mask, sorted_weights=None):
+        """KS distance between a sorted sample and the subsets selected by one or more masks (one per row)"""
+        masks = np.atleast_2d(sorted_mask)
+        if sorted_weights is None:
+            sorted_weights = np.ones(sorted_values.size)
+        group_ends = np.append(sorted_values[1:] != sorted_values[:-1], True)
+        cumulative_weights = np.cumsum(sorted_weights)
+        cdf_all = cumulative_weights[group_ends] / cumulative_weights[-1]
+        counts = np.cumsum(masks * sorted_weights, axis=1)[:, group_ends]
+        cdf_subset = counts / counts[:, -1:]
+        distances = np.max(np.abs(cdf_all - cdf_subset), axis=1)
+        return distances if np.ndim(sorted_mask) > 1 else distances[0]
+
     @staticmethod
     def compute_spherical_coords(df):
         xyz = df[['A', 'B', 'C']]
@@ -143,20 +375,63 @@ EOF""".format(**self.__dict__)
         return cumsum
 
     @staticmethod
-    def get_density_abc_weighted(df, weigth):
+    def get_cumulative_density_weighted(density, multiplicity):
+        """Equivalent of :py:meth:`get_cumulative_density` for a table with one row per unique reflection, averaged
+        over the rows each unique reflection would have in the P1 expanded table"""
+        density = np.asarray(density, dtype=float)
+        multiplicity = np.asarray(multiplicity, dtype=np.int64)
+        start = np.cumsum(multiplicity) - multiplicity
+        previous = np.cumsum(multiplicity * density) - multiplicity * density
+        group_sum = multiplicity * previous + density * multiplicity * (multiplicity + 1) / 2
+        group_offset = np.cumsum(group_sum) - group_sum
+        nrows = multiplicity.sum()
+
+        def partial_sum(rank):
+            group = np.searchsorted(start, rank, side='right') - 1
+            k = rank - start[group]
+            return group_offset[group] + k * previous[group] + density[group] * k * (k + 1) / 2
+
+        return (partial_sum(nrows - start) - partial_sum(nrows - start - multiplicity)) / multiplicity
+
+    @staticmethod
+    def get_weighted_quantile(values, weights, quantile):
+        order = np.argsort(values)
+        cumulative_weights = np.cumsum(weights[order])
+        position = np.searchsorted(cumulative_weights, quantile * cumulative_weights[-1])
+        return values[order][min(position, values.size - 1)]
+
+    @staticmethod
+    def get_density_abc_weighted(df, weigth, mode='exact', **kwargs):
         tmp_df = df[['A', 'B', 'C']]
         values = tmp_df.T
-        kde = gaussian_kde(values, weights=df[weigth])
+        kde = get_kde_engine(mode)(values, weights=df[weigth], **kwargs)
         return kde(values)
 
     @staticmethod
-    def compute_df(reflections, experiments, expand_to_p1=True):
-
+    def get_observed_set(reflections, experiments, expand_to_p1=True, asu_weighted=False):
         miller_array = reflections.as_miller_array(experiments[0])
         observed_set = miller_array.unique_under_symmetry().map_to_asu()
+        if asu_weighted:
+            return observed_set.customized_copy(anomalous_flag=False).unique_under_symmetry()
+        elif expand_to_p1:
+            return observed_set.generate_bijvoet_mates()
+        return observed_set
 
-        if expand_to_p1:
-            observed_set = observed_set.generate_bijvoet_mates()
+    @staticmethod
+    def compute_df(reflections, experiments, expand_to_p1=True, asu_weighted=False, compact=False, cache_dir=None):
+
+        observed_set = Completeness.get_observed_set(reflections, experiments, expand_to_p1, asu_weighted)
+
+        if cache_dir is not None:
+            return Completeness.get_cached_reflection_columns(observed_set, CompleteSetCache(cache_dir),
+                                                              expand_to_p1, asu_weighted, compact)
+
+        if asu_weighted:
+            complete_set = observed_set.complete_set()
+            missing_set = complete_set.lone_set(observed_set)
+            return Completeness.get_reflection_columns(complete_set, missing_set, asu_weighted=True, compact=compact)
+
+        elif expand_to_p1:
             complete_set = observed_set.complete_set()
             missing_set = complete_set.lone_set(observed_set)
             missing_set = missing_set.expand_to_p1()
@@ -166,29 +441,157 @@ EOF""".format(**self.__dict__)
             complete_set = observed_set.complete_set()
             missing_set = complete_set.lone_set(observed_set)
 
-        uc = complete_set.unit_cell()
-        complete_set_d_spacings = complete_set.d_spacings()
+        return Completeness.get_reflection_columns(complete_set, missing_set, compact=compact)
 
-        df = []
-        missing_indices = set(missing_set.indices())
-        for idx in complete_set_d_spacings:
-            rlp = uc.reciprocal_space_vector(idx[0])
-            if (idx[0][0], idx[0][1], idx[0][2]) in missing_indices:
-                row = [idx[0][0], idx[0][1], idx[0][2], rlp[0], rlp[1], rlp[2], idx[1], False]
-            else:
-                row = [idx[0][0], idx[0][1], idx[0][2], rlp[0], rlp[1], rlp[2], idx[1], True]
+    @staticmethod
+    def get_cached_reflection_columns(observed_set, cache, expand_to_p1=True, asu_weighted=False, compact=False,
+                                      d_min_tolerance=1e-6):
+        """Same table as :py:func:`get_reflection_columns` built from the indices in a
+        :py:obj:`~confetti.completeness.cache.CompleteSetCache`, only OBSERVED and the unit cell dependent columns are
+        computed here"""
+        expand_to_p1 = expand_to_p1 and not asu_weighted
+        arrays = cache.get_complete_set(observed_set, expand_to_p1, asu_weighted)
+        frac = Completeness.get_fractionalization_matrix(observed_set.unit_cell())
+        abc = arrays['hkl'].dot(frac)
+        d_spacings = 1 / np.linalg.norm(abc, axis=1)
+        selection = d_spacings >= observed_set.d_min() * (1 - d_min_tolerance)
+        hkl = arrays['hkl'][selection]
+        abc = abc[selection]
+        hkl_keys = pack_hkl_array(hkl)
+        if expand_to_p1:
+            observed_set = observed_set.expand_to_p1()
+        observed = isin_keys(hkl_keys, miller_index_keys(observed_set.indices()))
+        multiplicity = None
+        centric = None
+        if asu_weighted:
+            multiplicity = arrays['multiplicity'][selection]
+            centric = arrays['centric'][selection]
+        return Completeness.get_table_columns(hkl, abc, d_spacings[selection], observed, hkl_keys, multiplicity,
+                                              centric, compact)
+
+    @staticmethod
+    def compute_df_from_mtz(mtz, symmetry_expander, expand_to_p1=True, asu_weighted=False, compact=False,
+                            d_min_tolerance=1e-6):
+        """Equivalent of :py:func:`compute_df` for a merged :py:obj:`gemmi.Mtz`
+
+        A reflection is observed when any of its intensity or amplitude columns has a value. The unique reflections
+        are generated with :py:func:`gemmi.make_miller_array` and expanded into P1 or weighted by their multiplicity
+        with the ``symmetry_expander``, so only numpy and gemmi are needed.
+        """
+        import gemmi
+
+        data = np.array(mtz, copy=False)
+        data_columns = [idx for idx, column in enumerate(mtz.columns) if column.type in ('J', 'F', 'K', 'G')]
+        mtz_hkl = mtz.make_miller_array().astype(np.int64)
+        if data_columns:
+            mtz_hkl = mtz_hkl[np.any(~np.isnan(data[:, data_columns]), axis=1)]
+        frac = np.array(mtz.cell.fractionalization_matrix.tolist())
+        d_min = 1 / np.linalg.norm(mtz_hkl.dot(frac), axis=1).max()
+
+        unique_hkl = np.asarray(gemmi.make_miller_array(mtz.cell, mtz.spacegroup, d_min * (1 - d_min_tolerance)),
+                                dtype=np.int64)
+        multiplicity = None
+        centric = None
+        if asu_weighted:
+            hkl = unique_hkl
+            keys = np.sort(symmetry_expander.expand_keys(hkl, friedel=True), axis=1)
+            multiplicity = 1 + np.count_nonzero(keys[:, 1:] != keys[:, :-1], axis=1)
+            centric = np.any(symmetry_expander.expand_keys(hkl, friedel=False) == pack_hkl_array(-hkl)[:, None],
+                             axis=1)
+        elif expand_to_p1:
+            hkl = np.stack(unpack_hkl(symmetry_expander.equivalent_keys(unique_hkl, friedel=True)), axis=1)
+        else:
+            hkl = unique_hkl
+
+        abc = hkl.dot(frac)
+        hkl_keys = pack_hkl_array(hkl)
+        observed = isin_keys(hkl_keys, symmetry_expander.equivalent_keys(mtz_hkl, friedel=True))
+        return Completeness.get_table_columns(hkl, abc, 1 / np.linalg.norm(abc, axis=1), observed, hkl_keys,
+                                              multiplicity, centric, compact)
 
-            df.append(row)
+    @staticmethod
+    def get_shell_edges(d_min, nshells, d_min_tolerance=1e-6):
+        """Resolution shell edges from low to high resolution, each shell spans the same reciprocal volume"""
+        d_star_cubed = np.linspace(0, (1 / d_min) ** 3, nshells + 1)
+        with np.errstate(divide='ignore'):
+            edges = 1 / np.cbrt(d_star_cubed)
+        edges[-1] = d_min * (1 - d_min_tolerance)
+        return edges
 
-        df = pd.DataFrame(df)
-        df.columns = ['H', 'K', 'L', 'A', 'B', 'C', 'RES', 'OBSERVED']
+    @staticmethod
+    def compute_df_shells(reflections, experiments, expand_to_p1=True, asu_weighted=False, nshells=16,
+                          compact=False):
+        """Generate the table of :py:func:`compute_df` one resolution shell at a time, from low to high resolution
+
+        Each shell of the complete set is built on its own with :py:func:`cctbx.miller.build_set`, so only the
+        reflections of one shell are held in memory. Concatenating the shells gives the table sorted by RES.
+        """
+        from cctbx import miller, array_family
+
+        observed_set = Completeness.get_observed_set(reflections, experiments, expand_to_p1, asu_weighted)
+        edges = Completeness.get_shell_edges(observed_set.d_min(), nshells)
+
+        for d_max, d_min in zip(edges[:-1], edges[1:]):
+            shell_set = miller.build_set(observed_set, observed_set.anomalous_flag(), d_min=d_min * (1 - 1e-6),
+                                         d_max=d_max * (1 + 1e-6) if np.isfinite(d_max) else None)
+            d_spacings = shell_set.d_spacings().data().as_numpy_array()
+            complete_set = shell_set.select(array_family.flex.bool((d_spacings >= d_min) & (d_spacings < d_max)))
+            if complete_set.size() == 0:
+                continue
+            missing_set = complete_set.lone_set(observed_set)
+            if expand_to_p1 and not asu_weighted:
+                missing_set = missing_set.expand_to_p1()
+                complete_set = complete_set.expand_to_p1()
+            yield Completeness.get_reflection_columns(complete_set, missing_set, asu_weighted, compact)
+
+    @staticmethod
+    def get_reflection_columns(complete_set, missing_set, asu_weighted=False, compact=False):
+        hkl = complete_set.indices().as_vec3_double().as_numpy_array().astype(np.int64)
+        d_spacings = complete_set.d_spacings().data().as_numpy_array()
+        frac = Completeness.get_fractionalization_matrix(complete_set.unit_cell())
+        abc = hkl.dot(frac)
+        hkl_keys = pack_hkl_array(hkl)
+        observed = ~isin_keys(hkl_keys, miller_index_keys(missing_set.indices()))
+        multiplicity = None
+        centric = None
+        if asu_weighted:
+            multiplicity = complete_set.multiplicities().data().as_numpy_array()
+            centric = complete_set.centric_flags().data().as_numpy_array()
+        return Completeness.get_table_columns(hkl, abc, d_spacings, observed, hkl_keys, multiplicity, centric, compact)
+
+    @staticmethod
+    def get_table_columns(hkl, abc, d_spacings, observed, hkl_keys, multiplicity=None, centric=None, compact=False):
+        df = pd.DataFrame({'H': hkl[:, 0], 'K': hkl[:, 1], 'L': hkl[:, 2], 'A': abc[:, 0], 'B': abc[:, 1],
+                           'C': abc[:, 2], 'RES': d_spacings, 'OBSERVED': observed, 'HKL_KEY': hkl_keys})
+        if multiplicity is not None:
+            df['MULTIPLICITY'] = multiplicity
+            df['IS_CENTRIC'] = centric
         df.sort_values(by='RES', inplace=True, ascending=False)
         df.reset_index(drop=True, inplace=True)
+        if compact:
+            apply_compact_schema(df)
         return df
 
+    @staticmethod
+    def get_hull_volume(points):
+        try:
+            return ConvexHull(points).volume
+        except QhullError:
+            return 0
+
+    @staticmethod
+    def get_voxel_keys(points, voxel_size):
+        """Packed keys of the voxels of a grid with spacing ``voxel_size`` (centred at the origin) containing each
+        point"""
+        voxels = np.floor(np.asarray(points, dtype=float) / voxel_size + 0.5).astype(np.int64)
+        return pack_hkl_array(voxels)
+
     # ------------------ Methods ------------------
 
     def register_raw_data(self, experiments_fname, reflections_fname, update_table=False):
+        from confetti.io.reflections_parser import Reflections
+        from confetti.io.experiments_parser import Experiments
+
         self.experiments_fname = experiments_fname
         self.experiments = Experiments(experiments_fname)
         self.reflections_fname = reflections_fname
@@ -197,188 +600,431 @@ EOF""".format(**self.__dict__)
         if update_table:
             self.update_table()
 
-    def update_table(self):
-        new_df = self.compute_df(self.reflections.data, self.experiments.data, expand_to_p1=self.is_p1)
-        observed_indices = set(new_df.loc[new_df.OBSERVED][['H', 'K', 'L']].to_records(index=False).tolist())
-        self.table['OBSERVED'] = [True if (h, k, l) in observed_indices else False
-                                  for h, k, l in zip(self.table.H, self.table.K, self.table.L)]
+    def invalidate_cache(self, table_changed=False):
+        self._summary_statistics = None
+        if table_changed:
+            self._total_volume = {}
+            self._hkl_key_sorter = None
+            self._sort_orders = {}
+            self._reciprocal_matrix = None
+
+    def get_sort_order(self, column):
+        if column not in self._sort_orders:
+            self._sort_orders[column] = np.argsort(self.table[column].values, kind='stable')
+        return self._sort_orders[column]
+
+    def compute_summary_statistics(self):
+        observed = self.table['OBSERVED'].values.astype(bool)
+        multiplicity = self.multiplicity
+        statistics = {}
+
+        coords = ('r', 'phi', 'theta')
+        if self.is_asu_weighted:
+            coords = ('r',)
+            p1_table, owners = self.expand_to_p1(self.table)
+            r, theta, phi = self.compute_spherical_coords(p1_table)
+            for coord, values in (('phi', phi), ('theta', theta)):
+                order = np.argsort(values, kind='stable')
+                statistics['ksd_{}'.format(coord)] = self.get_ks_statistic_masked(values[order],
+                                                                                  observed[owners][order])
+        for coord in coords:
+            order = self.get_sort_order(coord)
+            statistics['ksd_{}'.format(coord)] = self.get_ks_statistic_masked(
+                self.table[coord].values[order], observed[order], multiplicity[order])
+
+        order = self.get_sort_order('RES')
+        resolution = np.repeat(self.table['RES'].values[order], multiplicity[order])
+        resolution_observed = np.repeat(observed[order], multiplicity[order])
+        statistics['ksd_r_prime'] = self.get_ks_statistic(np.cumsum(resolution),
+                                                          np.cumsum(resolution[resolution_observed]))
+
+        missing_density = self.table['NORM_WEIGHTED_DENSITY'].values[~observed]
+        order = np.argsort(missing_density)
+        missing_density = missing_density[order]
+        weight_above = np.append(np.cumsum(multiplicity[~observed][order][::-1])[::-1], 0)
+        for threshold in (0.3, 0.6, 0.9):
+            position = np.searchsorted(missing_density, threshold, side='right')
+            statistics['high_density_{}'.format(threshold)] = weight_above[position] / weight_above[0]
+
+        statistics['volume_ratio'] = self.get_volume_ratio(self.volume_method, self.voxel_size)
+        return statistics
+
+    def expand_to_p1(self, df):
+        """Expand a table with one row per unique reflection into the A/B/C coordinates of its P1 reflections,
+        returns these and the position of the row each P1 reflection comes from"""
+        keys = self.symmetry_expander.expand_keys(df[['H', 'K', 'L']].values, friedel=True)
+        owners = np.repeat(np.arange(df.shape[0]), keys.shape[1])
+        keys, first = np.unique(keys.ravel(), return_index=True)
+        abc = np.stack(unpack_hkl(keys), axis=1).dot(self.reciprocal_matrix)
+        return pd.DataFrame({'A': abc[:, 0], 'B': abc[:, 1], 'C': abc[:, 2]}), owners[first]
+
+    def save_table(self, fname):
+        """Write the table as csv, zstd compressed parquet/feather or a per-column .npy store according to the file
+        extension, together with a json file holding the space group and unit cell of the table"""
+        table_format = self.get_table_format(fname)
+        if table_format == 'parquet':
+            self.table.to_parquet(fname, compression='zstd', index=False)
+        elif table_format == 'feather':
+            self.table.reset_index(drop=True).to_feather(fname, compression='zstd')
+        elif table_format == 'npy':
+            write_column_store(self.table, fname)
+        else:
+            self.table.to_csv(fname)
+        self.write_table_metadata(fname)
+
+    def write_table_metadata(self, fname):
+        matrix = self.fractionalization_matrix
+        metadata = {'is_p1': bool(self.is_p1), 'is_asu_weighted': bool(self.is_asu_weighted),
+                    'space_group_hall': self.space_group_hall,
+                    'fractionalization_matrix': None if matrix is None else np.asarray(matrix).tolist()}
+        self.write_json(metadata, self.get_metadata_fname(fname))
+
+    def write_summary(self, fname):
+        """Write the summary and the inputs used to create the table into a json sidecar file"""
+        sidecar = {'summary': self.summary_dict,
+                   'inputs': {'table_fname': self.table_out_fname, 'is_asu_weighted': self.is_asu_weighted,
+                              'space_group_hall': self.space_group_hall, 'density_mode': self.density_mode,
+                              'res_density_mode': self.res_density_mode}}
+        self.write_json(sidecar, fname)
+
+    def compact_table(self):
+        saved = apply_compact_schema(self.table)
+        self.logger.info('Compact schema saved {:.1f} MB of table memory'.format(saved / 1024 ** 2))
+        return saved
+
+    def get_hkl_keys(self):
+        if 'HKL_KEY' not in self.table.columns:
+            self.table['HKL_KEY'] = pack_hkl(self.table.H.values, self.table.K.values, self.table.L.values)
+        return self.table.HKL_KEY.values
+
+    def get_rows(self, keys):
+        hkl_keys = self.get_hkl_keys()
+        if self._hkl_key_sorter is None:
+            self._hkl_key_sorter = np.argsort(hkl_keys)
+        position = np.searchsorted(hkl_keys, keys, sorter=self._hkl_key_sorter)
+        position[position == hkl_keys.size] = 0
+        rows = self._hkl_key_sorter[position]
+        return rows[hkl_keys[rows] == keys]
+
+    def update_table(self, deleted_keys=None):
+        if deleted_keys is None:
+            new_df = self.compute_df(self.reflections.data, self.experiments.data, expand_to_p1=self.is_p1,
+                                     asu_weighted=self.is_asu_weighted)
+            observed_keys = new_df.loc[new_df.OBSERVED].HKL_KEY.values
+            self.table['OBSERVED'] = isin_keys(self.get_hkl_keys(), observed_keys)
+        else:
+            rows = self.get_rows(np.asarray(deleted_keys, dtype=np.int64))
+            self.table.iloc[rows, self.table.columns.get_loc('OBSERVED')] = False
+        self.invalidate_cache()
 
-    def get_reflection_table(self, expand_to_p1=True):
+    def get_reflection_table(self, expand_to_p1=True, asu_weighted=False, compact=False, cache_dir=None):
         if self.reflections is None:
             self.logger.error('No reflections registered!')
             return
 
         self.logger.info('Creating reflection table')
-        df = self.compute_df(self.reflections.data, self.experiments.data, expand_to_p1)
+        df = self.compute_df(self.reflections.data, self.experiments.data, expand_to_p1, asu_weighted,
+                             cache_dir=cache_dir)
         self.logger.info('Loading spherical coords')
         r, theta, phi = self.compute_spherical_coords(df)
         df['r'] = r
         df['phi'] = phi
         df['theta'] = theta
         self.table = df
-        self.is_p1 = expand_to_p1
+        if compact:
+            self.compact_table()
+        self.is_p1 = expand_to_p1 and not asu_weighted
+        self.is_asu_weighted = asu_weighted
+        crystal = self.experiments.data[0].crystal
+        self.space_group_hall = crystal.get_space_group().type().hall_symbol()
+        self.fractionalization_matrix = self.get_fractionalization_matrix(crystal.get_unit_cell())
+        self.invalidate_cache(table_changed=True)
+
+    def stream_reflection_table(self, store_dirname, expand_to_p1=True, asu_weighted=False, nshells=16,
+                                compact=False):
+        """Create the reflection table shell by shell into a column store and open it memory-mapped
+
+        Only table creation is bounded by the size of the largest resolution shell. The density, clustering and summary
+        steps read whole columns, so the peak memory of a complete job is still of the order of the full table. The
+        table is opened in copy-on-write mode, so later steps can modify it without changing the files on disk.
+        """
+        if self.reflections is None:
+            self.logger.error('No reflections registered!')
+            return
 
-    def get_res_density(self):
+        self.logger.info('Creating reflection table in {} resolution shells'.format(nshells))
+        with ColumnStoreWriter(store_dirname) as writer:
+            for df in self.compute_df_shells(self.reflections.data, self.experiments.data, expand_to_p1,
+                                             asu_weighted, nshells):
+                r, theta, phi = self.compute_spherical_coords(df)
+                df['r'] = r
+                df['phi'] = phi
+                df['theta'] = theta
+                if compact:
+                    apply_compact_schema(df)
+                writer.append(df)
+        self.logger.info('Reflection table with {} rows written to {}'.format(writer.nrows, store_dirname))
+
+        self.table = read_column_store(store_dirname, mmap_mode='c')
+        self.is_p1 = expand_to_p1 and not asu_weighted
+        self.is_asu_weighted = asu_weighted
+        crystal = self.experiments.data[0].crystal
+        self.space_group_hall = crystal.get_space_group().type().hall_symbol()
+        self.fractionalization_matrix = self.get_fractionalization_matrix(crystal.get_unit_cell())
+        self.invalidate_cache(table_changed=True)
+
+    def get_res_density(self, mode='exact', **kwargs):
+        """Compute RES_DENSITY and RES_CUMSUM columns
+
+        With ``mode='binned'`` the 1D density is obtained by linear binning and FFT convolution on a grid of 0.05
+        bandwidths, using the same bandwidth rule as the exact KDE. The absolute error of RES_DENSITY is then bounded by
+        1e-3 times the kernel peak and RES_CUMSUM deviates from the exact cumulative sum by at most the sum of these
+        per-reflection errors.
+
+        For ASU weighted tables the kernel bandwidth is scaled with :py:func:`get_multiplicity_bw_method`, so the
+        density at each unique reflection equals the density of its reflections in the P1 expanded table.
+        """
         self.logger.info('Calculating resolution density')
-        self.table['RES_DENSITY'] = self.get_density(self.table['RES'])
-        self.table['RES_CUMSUM'] = self.get_cumulative_density(self.table['RES_DENSITY'])
+        if mode == 'binned':
+            kwargs.setdefault('grid_spacing', 0.05)
+        if self.is_asu_weighted:
+            kwargs.setdefault('bw_method', get_multiplicity_bw_method(self.multiplicity))
+            self.table['RES_DENSITY'] = self.get_density(self.table['RES'], mode, weights=self.multiplicity, **kwargs)
+            self.table['RES_CUMSUM'] = self.get_cumulative_density_weighted(self.table['RES_DENSITY'],
+                                                                            self.multiplicity)
+        else:
+            self.table['RES_DENSITY'] = self.get_density(self.table['RES'], mode, **kwargs)
+            self.table['RES_CUMSUM'] = self.get_cumulative_density(self.table['RES_DENSITY'])
 
     def get_unique_reflections(self):
         if self.reflections is None:
-            self.logger.error('No reflections registered!')
+            self.logger.info('No reflections registered, using the table symmetry to find unique reflections')
+            self.get_unique_reflections_from_symmetry()
             return
 
+        from cctbx import miller
+
         miller_array = self.reflections.data.as_miller_array(self.experiments.data[0])
-        space_group = miller_array.space_group()
         miller_unique = miller_array.unique_under_symmetry()
 
-        unique_idx = set(miller_unique.map_to_asu().complete_set().indices())
-        bijvoet_idx = set(miller_unique.generate_bijvoet_mates().map_to_asu().complete_set().indices())
-        all_indices = [(h, k, l) for h, k, l in zip(self.table.H, self.table.K, self.table.L)]
-        is_bijvoet = []
-        is_unique = []
-        unique_dict = {}
+        unique_keys = miller_index_keys(miller_unique.map_to_asu().complete_set().indices())
+        bijvoet_keys = miller_index_keys(miller_unique.generate_bijvoet_mates().map_to_asu().complete_set().indices())
+        hkl_keys = self.get_hkl_keys()
+        is_unique = isin_keys(hkl_keys, unique_keys)
+        is_bijvoet = isin_keys(hkl_keys, bijvoet_keys)
 
-        for idx, index in enumerate(all_indices):
-            if index in bijvoet_idx:
-                is_bijvoet.append(True)
-            else:
-                is_bijvoet.append(False)
-            if index in unique_idx:
-                is_unique.append(True)
-                equiv_indices = [equiv.mate().hr() for equiv in miller.sym_equiv_indices(space_group, index).indices()]
-                equiv_indices += [equiv.mate().h() for equiv in miller.sym_equiv_indices(space_group, index).indices()]
-                for equiv in equiv_indices:
-                    unique_dict[equiv] = idx
-            else:
-                is_unique.append(False)
-        unique_ids = [unique_dict[(h, k, l)] for h, k, l in zip(self.table.H, self.table.K, self.table.L)]
+        hkl = self.table[['H', 'K', 'L']].values
+        table_set = miller.set(miller_unique.crystal_symmetry(), flex_miller_index(hkl), anomalous_flag=False)
+        asu_keys = miller_index_keys(table_set.map_to_asu().indices())
+        sorter = np.argsort(hkl_keys)
+        unique_ids = sorter[np.searchsorted(hkl_keys, asu_keys, sorter=sorter)]
 
         self.table['IS_UNIQUE'] = is_unique
         self.table['IS_BIJVOET'] = is_bijvoet
         self.table['UNIQUE_ID'] = unique_ids
-
-    def get_missing_observed_density_abc_weighted(self, weight):
+        self.invalidate_cache()
+
+    def get_unique_reflections_from_symmetry(self):
+        """Same columns as :py:func:`get_unique_reflections` without cctbx, the representative of a set of equivalent
+        table rows is the one with the largest packed HKL key rather than the one in the cctbx ASU"""
+        hkl = self.table[['H', 'K', 'L']].values
+        hkl_keys = self.get_hkl_keys()
+        chunk_size = self.symmetry_expander.chunk_size
+        representatives = {}
+        for friedel in (True, False):
+            representative = np.empty(hkl.shape[0], dtype=np.int64)
+            for start in range(0, hkl.shape[0], chunk_size):
+                keys = self.symmetry_expander.expand_keys(hkl[start:start + chunk_size], friedel)
+                keys = np.where(isin_keys(keys, hkl_keys), keys, np.iinfo(np.int64).min)
+                representative[start:start + chunk_size] = keys.max(axis=1)
+            representatives[friedel] = representative
+
+        sorter = np.argsort(hkl_keys)
+        self.table['IS_UNIQUE'] = hkl_keys == representatives[True]
+        self.table['IS_BIJVOET'] = hkl_keys == representatives[False]
+        self.table['UNIQUE_ID'] = sorter[np.searchsorted(hkl_keys, representatives[True], sorter=sorter)]
+        self.invalidate_cache()
+
+    def get_density_abc_weighted_asu(self, df, weight, mode='exact', **kwargs):
+        """Weighted density at the rows of a table with one row per unique reflection, fitted on their P1 reflections"""
+        p1_df, owners = self.expand_to_p1(df)
+        kde = get_kde_engine(mode)(p1_df.values.T, weights=df[weight].values[owners], **kwargs)
+        return kde(df[['A', 'B', 'C']].values.T)
+
+    def get_missing_observed_density_abc_weighted(self, weight, mode='exact', **kwargs):
         self.logger.info('Calculating missing reflection ABC weighted density')
 
-        obs_df = self.table[self.table['OBSERVED']]
-        missing_df = self.table[~self.table['OBSERVED']]
-        observed_density = self.get_density_abc_weighted(obs_df, weight)
-        missing_density = self.get_density_abc_weighted(missing_df, weight)
-        observed_idx = 0
-        missing_idx = 0
-        result = []
-        for is_observed in self.table['OBSERVED'].to_list():
-            if is_observed:
-                result.append(observed_density[observed_idx])
-                observed_idx += 1
-            else:
-                result.append(missing_density[missing_idx])
-                missing_idx += 1
+        observed = self.table['OBSERVED'].values.astype(bool)
+        get_density = self.get_density_abc_weighted_asu if self.is_asu_weighted else self.get_density_abc_weighted
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            observed_density = executor.submit(get_density, self.table.loc[observed], weight, mode, **kwargs)
+            missing_density = executor.submit(get_density, self.table.loc[~observed], weight, mode, **kwargs)
+            result = np.empty(self.table.shape[0])
+            result[observed] = observed_density.result()
+            result[~observed] = missing_density.result()
 
         self.table['WEIGHTED_DENSITY'] = result
         norm_density = (self.table.WEIGHTED_DENSITY - self.table.WEIGHTED_DENSITY.min()) / \
                        (self.table.WEIGHTED_DENSITY.max() - self.table.WEIGHTED_DENSITY.min())
         self.table['NORM_WEIGHTED_DENSITY'] = norm_density
+        self.invalidate_cache()
 
     def get_ratio_high_density_reflections(self, threshold=0.3):
-        return self.table.loc[(~self.table.OBSERVED) & (self.table.NORM_WEIGHTED_DENSITY > threshold)].shape[0] / \
-               self.table.loc[(~self.table.OBSERVED)].shape[0]
-
-    def get_meanshift_labels(self, bandwidth=0.05, njobs=1, threshold_quantile=0.75):
-        threshold = self.table.loc[(~self.table.OBSERVED)]['WEIGHTED_DENSITY'].quantile(threshold_quantile)
-        X = self.table.loc[(~self.table['OBSERVED']) & (self.table['WEIGHTED_DENSITY'] > threshold)][['A', 'B', 'C']]
-        clustering = MeanShift(bandwidth=bandwidth, n_jobs=njobs).fit(X)
-        labels = []
-        idx = 0
-        for is_observed, abc_density in zip(self.table['OBSERVED'].to_list(), self.table['WEIGHTED_DENSITY'].to_list()):
-            if abc_density > threshold and not is_observed:
-                labels.append(clustering.labels_[idx])
-                idx += 1
-            else:
-                labels.append(np.nan)
+        missing_density = self.table['NORM_WEIGHTED_DENSITY'].values[~self.table['OBSERVED'].values.astype(bool)]
+        return np.count_nonzero(missing_density > threshold) / missing_density.size
+
+    def get_clustering_selection(self, threshold_quantile=0.75):
+        """Mask of the missing reflections with a weighted density above the given quantile"""
+        if self.is_asu_weighted:
+            missing = ~self.table['OBSERVED'].values.astype(bool)
+            threshold = self.get_weighted_quantile(self.table['WEIGHTED_DENSITY'].values[missing],
+                                                   self.multiplicity[missing], threshold_quantile)
+        else:
+            threshold = self.table.loc[(~self.table.OBSERVED)]['WEIGHTED_DENSITY'].quantile(threshold_quantile)
+        return ~self.table['OBSERVED'].values.astype(bool) & (self.table['WEIGHTED_DENSITY'].values > threshold)
+
+    def get_meanshift_labels(self, bandwidth=0.05, njobs=1, threshold_quantile=0.75, seeds=None, backend='meanshift',
+                             min_samples=5):
+        """Cluster the high density missing reflections into the MEANSHIFT_LABELS column, see
+        :py:func:`~confetti.completeness.clustering.cluster_points` for the available backends. Noise points and
+        reflections not clustered are labelled NaN."""
+        selection = self.get_clustering_selection(threshold_quantile)
+        X = self.table[['A', 'B', 'C']].values[selection]
+        cluster_labels, self.meanshift_centers = cluster_points(X, backend, bandwidth, njobs, seeds, min_samples)
+        labels = np.full(self.table.shape[0], np.nan)
+        labels[selection] = np.where(cluster_labels >= 0, cluster_labels, np.nan)
 
         self.table['MEANSHIFT_LABELS'] = labels
+        self.invalidate_cache()
+
+    def benchmark_clustering_backends(self, backends=('meanshift', 'meanshift_binned', 'dbscan', 'hdbscan'),
+                                      bandwidth=0.05, njobs=1, threshold_quantile=0.75, min_samples=5,
+                                      reference='meanshift'):
+        """Time each clustering backend on the current table and compare its labels with those of ``reference``
+        using the adjusted Rand index, noise points are treated as one more cluster. The table is not modified."""
+        X = self.table[['A', 'B', 'C']].values[self.get_clustering_selection(threshold_quantile)]
+        results = {}
+        for backend in (reference, *[backend for backend in backends if backend != reference]):
+            start = time.perf_counter()
+            labels, centers = cluster_points(X, backend, bandwidth, njobs, min_samples=min_samples)
+            results[backend] = (time.perf_counter() - start, labels, centers.shape[0])
+            self.logger.info('Clustering backend {} took {:.2f} s'.format(backend, results[backend][0]))
+
+        reference_labels = results[reference][1]
+        benchmark = [(backend, elapsed, nclusters, np.count_nonzero(labels < 0),
+                      adjusted_rand_score(reference_labels, labels)) for backend, (elapsed, labels, nclusters) in
+                     results.items()]
+        return pd.DataFrame(benchmark, columns=['BACKEND', 'TIME', 'N_CLUSTERS', 'N_NOISE', 'ARI'])
 
     def get_cluster_hull_volume(self, cluster_label):
         tmp_df = self.table[self.table['MEANSHIFT_LABELS'] == cluster_label][['A', 'B', 'C']]
-        try:
-            tmp_df.reset_index(drop=True, inplace=True)
-            hull = ConvexHull(tmp_df)
-            return hull.volume
-        except QhullError:
-            return 0
+        tmp_df.reset_index(drop=True, inplace=True)
+        return self.get_hull_volume(tmp_df)
 
-    def get_volume_ratio(self):
+    def get_total_volume(self, method='hull', voxel_size=None):
+        if (method, voxel_size) not in self._total_volume:
+            if self.is_asu_weighted:
+                points = self.expand_to_p1(self.table)[0].values
+            else:
+                points = self.table[['A', 'B', 'C']].values
+            if method == 'voxel':
+                volume = np.unique(self.get_voxel_keys(points, voxel_size)).size * voxel_size ** 3
+            else:
+                volume = ConvexHull(points).volume
+            self._total_volume[(method, voxel_size)] = volume
+        return self._total_volume[(method, voxel_size)]
+
+    def get_volume_ratio(self, method='hull', voxel_size=None, nprocs=1):
+        """Ratio between the volume of the MeanShift clusters of missing reflections and the total volume
+
+        With ``method='hull'`` volumes are those of the convex hulls of each cluster and of the whole table, computed
+        with ``nprocs`` threads across clusters. With ``method='voxel'`` reflections are binned on a grid with spacing
+        ``voxel_size`` and volumes are the number of occupied voxels times the voxel volume, which does not overestimate
+        non-convex clusters.
+        """
+        if method not in ('hull', 'voxel'):
+            raise ValueError('Unknown volume method {}'.format(method))
         if 'MEANSHIFT_LABELS' not in self.table.columns:
             self.get_meanshift_labels()
+        if method == 'voxel' and voxel_size is None:
+            voxel_size = self.default_voxel_size
+
+        codes, labels = pd.factorize(self.table['MEANSHIFT_LABELS'], sort=True)
+        clustered = codes >= 0
+        codes = codes[clustered]
+        points = self.table[['A', 'B', 'C']].values[clustered]
+
+        if labels.size == 0:
+            volumes = np.zeros(0)
+        elif method == 'voxel':
+            voxel_keys = self.get_voxel_keys(points, voxel_size)
+            cluster_voxels = np.unique(np.stack((codes, voxel_keys), axis=1), axis=0)
+            volumes = np.bincount(cluster_voxels[:, 0], minlength=labels.size) * voxel_size ** 3
+        else:
+            order = np.argsort(codes, kind='stable')
+            cluster_points = np.split(points[order], np.cumsum(np.bincount(codes, minlength=labels.size))[:-1])
+            with ThreadPoolExecutor(nprocs) as executor:
+                volumes = np.array(list(executor.map(self.get_hull_volume, cluster_points)))
+
+        if self.is_asu_weighted:
+            multiplicity = np.bincount(codes, weights=self.multiplicity[clustered], minlength=labels.size)
+            volumes = volumes * multiplicity / np.bincount(codes, minlength=labels.size)
+
+        return volumes.sum() / self.get_total_volume(method, voxel_size)
+
+    def get_missing_wedge_ratio(self, equivalents=True, chunk_size=65536):
+        """Fraction of the complete P1 set that is never rotated through the Ewald sphere by any of the sweeps
+
+        Computed analytically from the crystal, beam, goniometer and scan models of the experiments. Every table row
+        is expanded into its P1 equivalents, so the result does not depend on the table being in P1 or ASU form. With
+        ``equivalents=True`` a reflection counts as sampled when any of its symmetry mates is, which is the region
+        missing from the merged data. Otherwise the result is the fraction of P1 reflections outside the sampled
+        region. The per-row result is stored in the IS_SAMPLED column.
+        """
+        if self.experiments is None:
+            from confetti.io.experiments_parser import Experiments
+            self.experiments = Experiments(self.experiments_fname)
+        geometries = [RotationGeometry.from_experiment(experiment) for experiment in self.experiments.data]
+        geometries = [geometry for geometry in geometries if geometry is not None]
+        if not geometries:
+            self.logger.error('No rotation sweeps found in the experiments!')
+            return None
 
-        labels = tuple([x for x in self.table['MEANSHIFT_LABELS'].unique() if pd.notna(x)])
-
-        total_hull = ConvexHull(self.table[['A', 'B', 'C']])
-        missing_volume = 0
-        for clst_label in labels:
-            hull_volume = self.get_cluster_hull_volume(clst_label)
-            missing_volume += hull_volume
+        nsampled, nequivalents = count_sampled_equivalents(self.table[['H', 'K', 'L']].values, geometries,
+                                                           self.symmetry_expander, chunk_size)
+        is_sampled = nsampled > 0
+        sampled_fraction = nsampled / nequivalents
 
-        return missing_volume / total_hull.volume
+        self.table['IS_SAMPLED'] = is_sampled
+        weights = self.multiplicity
+        unsampled = ~is_sampled if equivalents else 1 - sampled_fraction
+        return np.sum(weights * unsampled) / weights.sum()
 
     def remove_random_sample(self, sample=0.1):
         if self.reflections is None:
             self.logger.error('No reflections registered!')
             return
 
-        miller_array = self.reflections.data.as_miller_array(self.experiments.data[0])
-        space_group = miller_array.space_group()
         delete_nreflections = round(self.table.loc[(self.table.IS_UNIQUE)].shape[0] * sample)
         self.logger.info('Deleting {} reflections at random'.format(delete_nreflections))
-        df_to_delete = self.table.sample(n=delete_nreflections, axis=0)
-
-        idx_delete = []
-        for h, k, l in zip(df_to_delete.H, df_to_delete.K, df_to_delete.L):
-            idx_delete += [equiv.mate().hr() for equiv in miller.sym_equiv_indices(space_group, (h, k, l)).indices()]
-            idx_delete += [equiv.mate().h() for equiv in miller.sym_equiv_indices(space_group, (h, k, l)).indices()]
-        idx_delete = set(idx_delete)
-
-        array_delete = [1 if idx in idx_delete else 0 for idx in self.reflections.data['miller_index']]
-        array_delete = array_family.flex.int(array_delete)
-        self.reflections.data['to_delete'] = array_delete
-        sel = self.reflections.data['to_delete'] == 1
-        self.reflections.data.del_selected(sel)
-        del self.reflections.data['to_delete']
+        weights = self.multiplicity if self.is_asu_weighted else None
+        df_to_delete = self.table.sample(n=delete_nreflections, axis=0, weights=weights)
 
-        self.update_table()
+        self.delete_reflections(df_to_delete[['H', 'K', 'L']].values)
 
     def remove_coord_range(self, sample=0.1, coord='phi'):
         if self.reflections is None:
             self.logger.error('No reflections registered!')
             return
 
-        miller_array = self.reflections.data.as_miller_array(self.experiments.data[0])
-        space_group = miller_array.space_group()
         nreflections = round(self.table.loc[(self.table.IS_UNIQUE)].shape[0] * sample)
         coord_threshold = self.table.loc[(self.table.IS_UNIQUE)].sort_values(by=coord)[coord].to_list()[nreflections]
         self.logger.info('Deleting {} reflections below {} {}'.format(nreflections, coord, coord_threshold))
         df_to_delete = self.table.loc[(self.table[coord] < coord_threshold) & (self.table.IS_UNIQUE)]
 
-        idx_delete = []
-        for h, k, l in zip(df_to_delete.H, df_to_delete.K, df_to_delete.L):
-            idx_delete += [equiv.mate().hr() for equiv in miller.sym_equiv_indices(space_group, (h, k, l)).indices()]
-            idx_delete += [equiv.mate().h() for equiv in miller.sym_equiv_indices(space_group, (h, k, l)).indices()]
-        idx_delete = set(idx_delete)
-
-        array_delete = [1 if idx in idx_delete else 0 for idx in self.reflections.data['miller_index']]
-        array_delete = array_family.flex.int(array_delete)
-        self.reflections.data['to_delete'] = array_delete
-        sel = self.reflections.data['to_delete'] == 1
-        self.reflections.data.del_selected(sel)
-        del self.reflections.data['to_delete']
-
-        self.update_table()
+        self.delete_reflections(df_to_delete[['H', 'K', 'L']].values)
 
     def remove_coord_chunks(self, sample=0.1, coord='phi', nchunks=2):
-        miller_array = self.reflections.data.as_miller_array(self.experiments.data[0])
-        space_group = miller_array.space_group()
         chunk_size = round(self.table.loc[(self.table.IS_UNIQUE)].shape[0] * sample / nchunks)
         self.logger.info('Deleting {} chunks of {} reflections each'.format(nchunks, chunk_size))
         df_sorted = self.table.loc[(self.table.IS_UNIQUE)].sort_values(by=coord)
@@ -393,17 +1039,14 @@ EOF""".format(**self.__dict__)
 
         df_to_delete = pd.concat(df_to_delete)
 
-        idx_delete = []
-        for h, k, l in zip(df_to_delete.H, df_to_delete.K, df_to_delete.L):
-            idx_delete += [equiv.mate().hr() for equiv in miller.sym_equiv_indices(space_group, (h, k, l)).indices()]
-            idx_delete += [equiv.mate().h() for equiv in miller.sym_equiv_indices(space_group, (h, k, l)).indices()]
-        idx_delete = set(idx_delete)
+        self.delete_reflections(df_to_delete[['H', 'K', 'L']].values)
+
+    def delete_reflections(self, hkl):
+        from cctbx import array_family
 
-        array_delete = [1 if idx in idx_delete else 0 for idx in self.reflections.data['miller_index']]
-        array_delete = array_family.flex.int(array_delete)
-        self.reflections.data['to_delete'] = array_delete
-        sel = self.reflections.data['to_delete'] == 1
+        delete_keys = self.symmetry_expander.equivalent_keys(hkl, friedel=True)
+        reflection_keys = miller_index_keys(self.reflections.data['miller_index'])
+        sel = array_family.flex.bool(isin_keys(reflection_keys, delete_keys))
         self.reflections.data.del_selected(sel)
-        del self.reflections.data['to_delete']
 
-        self.update_table()
+        self.update_table(delete_keys)
@@ -1,8 +1,10 @@
 import os
+import sys
 import pickle
 from pyjob import TaskFactory
 import logging
 from confetti.completeness import Completeness
+from confetti.completeness.schema import SUMMARY_SIDECAR_FNAME
 from confetti.wrappers import MtzDump
 
 
@@ -62,7 +64,16 @@ class CompletenessArray(object):
         if not os.path.isdir(self.workdir):
             os.mkdir(self.workdir)
 
-    def prepare_scripts(self, expand_to_p1=True, workdir_template='dataset_{}'):
+    def prepare_scripts(self, expand_to_p1=True, workdir_template='dataset_{}', asu_weighted=False,
+                        table_format='csv', nshells=None, cache_complete_sets=False, from_mtz=False):
+        """Create the job script of each completeness table
+
+        With ``nshells`` the tables are created shell by shell into a column store. This avoids holding the complete
+        set and the table under construction at once, but the later steps of each job still load whole columns.
+        """
+        if from_mtz and (nshells is not None or cache_complete_sets):
+            raise ValueError('Tables created from merged MTZ files cannot be streamed by shells or use the complete '
+                             'set cache, unset nshells and cache_complete_sets')
         self.make_workdir()
         for idx, input_fnames in enumerate(zip(self.input_experiments, self.input_reflections), 1):
             #mtz_fname = input_fnames[0].replace('scaled.expt', 'merged.mtz')
@@ -72,12 +83,22 @@ class CompletenessArray(object):
             workdir = os.path.join(self.workdir, workdir_template.format(idx))
             os.mkdir(workdir)
             dataset = Completeness()
-            dataset.is_p1 = expand_to_p1
+            dataset.is_p1 = expand_to_p1 and not asu_weighted
+            dataset.is_asu_weighted = asu_weighted
             dataset.experiments_fname = input_fnames[0]
             dataset.reflections_fname = input_fnames[1]
             dataset.workdir = workdir
             dataset.id = idx
-            dataset.csv_out_fname = os.path.join(workdir, 'completeness.csv')
+            dataset.table_out_fname = os.path.join(workdir, 'completeness.{}'.format(table_format))
+            dataset.summary_out_fname = os.path.join(workdir, SUMMARY_SIDECAR_FNAME)
+            if from_mtz:
+                dataset.mtz_fname = os.path.join(os.path.dirname(input_fnames[0]), 'merged_FREE.mtz')
+                dataset.python_exe = sys.executable
+            if cache_complete_sets:
+                dataset.cache_dir = os.path.join(self.workdir, 'complete_set_cache')
+            if nshells is not None:
+                dataset.store_dirname = os.path.join(workdir, 'reflection_table.npy')
+                dataset.nshells = nshells
             dataset.dials_exe = self.dials_exe
 
             self.completeness_tables.append(dataset)
@@ -102,11 +123,14 @@ class CompletenessArray(object):
             task.name = 'completeness-array'
             task.run()
 
-    def reload_tables(self):
+    def reload_tables(self, compact=False, columns=None):
         new_tables = []
         for table in self.completeness_tables:
-            if os.path.isfile(table.csv_out_fname):
-                updated_df = Completeness().from_csv(table.csv_out_fname, table.is_p1).table
-                table.table = updated_df.copy(True)
+            if os.path.exists(table.table_out_fname):
+                updated = Completeness().from_table_file(table.table_out_fname, table.is_p1, table.is_asu_weighted,
+                                                         compact=compact, columns=columns)
+                table.table = updated.table.copy(True)
+                table.space_group_hall = updated.space_group_hall
+                table.fractionalization_matrix = updated.fractionalization_matrix
                 new_tables.append(table)
         self.completeness_tables = new_tables
@@ -0,0 +1,87 @@
+import numpy as np
+from confetti.completeness.hkl import unpack_hkl
+
+
+class RotationGeometry(object):
+    """Analytical model of the reflections sampled by a single rotation sweep
+
+    A reflection with reciprocal lattice vector ``x = F A h`` is rotated into diffracting condition at the angles
+    where ``|S R(phi) x + s0| = |s0|``. Writing the rotation with Rodrigues' formula this becomes
+    ``a cos(phi) + b sin(phi) = c`` with ``a = x_perp . s0``, ``b = (e x x) . s0`` and ``c = -|x|^2 / 2 - x_par . s0``,
+    where ``s0`` has been rotated into the goniometer datum frame. The equation has no solution inside the blind
+    region (``c^2 > a^2 + b^2``) and two solutions otherwise, which are tested against the scan range.
+    """
+
+    def __init__(self, A, s0, rotation_axis, oscillation_range, fixed_rotation=None, setting_rotation=None):
+        self.A = np.asarray(A, dtype=float).reshape(3, 3)
+        self.rotation_axis = np.asarray(rotation_axis, dtype=float) / np.linalg.norm(rotation_axis)
+        self.oscillation_range = tuple(oscillation_range)
+        self.fixed_rotation = np.identity(3) if fixed_rotation is None else \
+            np.asarray(fixed_rotation, dtype=float).reshape(3, 3)
+        setting_rotation = np.identity(3) if setting_rotation is None else \
+            np.asarray(setting_rotation, dtype=float).reshape(3, 3)
+        self.s0 = setting_rotation.T.dot(np.asarray(s0, dtype=float))
+
+    # ------------------ Class methods ------------------
+
+    @classmethod
+    def from_experiment(cls, experiment):
+        """Create the model from a :py:obj:`dxtbx.model.Experiment`, returns None for stills"""
+        if experiment.scan is None or experiment.goniometer is None:
+            return None
+        goniometer = experiment.goniometer
+        return cls(experiment.crystal.get_A(), experiment.beam.get_s0(), goniometer.get_rotation_axis_datum(),
+                   experiment.scan.get_oscillation_range(deg=False), goniometer.get_fixed_rotation(),
+                   goniometer.get_setting_rotation())
+
+    # ------------------ Properties ------------------
+
+    @property
+    def oscillation_width(self):
+        return self.oscillation_range[1] - self.oscillation_range[0]
+
+    # ------------------ Methods ------------------
+
+    def get_rotation_angles(self, hkl):
+        """Return the two diffracting angles of each reflection in radians and a mask of those outside the blind
+        region"""
+        x = np.asarray(hkl, dtype=float).reshape(-1, 3).dot(self.A.T).dot(self.fixed_rotation.T)
+        x_par = np.outer(x.dot(self.rotation_axis), self.rotation_axis)
+        a = (x - x_par).dot(self.s0)
+        b = np.cross(self.rotation_axis, x).dot(self.s0)
+        c = -0.5 * np.einsum('ij,ij->i', x, x) - x_par.dot(self.s0)
+        radius = np.hypot(a, b)
+        crosses = (radius > 0) & (np.abs(c) <= radius)
+        base = np.arctan2(b, a)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            delta = np.arccos(np.clip(c / radius, -1, 1))
+        return base - delta, base + delta, crosses
+
+    def is_in_scan(self, phi):
+        if self.oscillation_width >= 2 * np.pi:
+            return np.ones(np.shape(phi), dtype=bool)
+        return np.mod(phi - self.oscillation_range[0], 2 * np.pi) <= self.oscillation_width
+
+    def is_sampled(self, hkl):
+        """Mask of the reflections that cross the Ewald sphere within the scan range"""
+        phi_1, phi_2, crosses = self.get_rotation_angles(hkl)
+        return crosses & (self.is_in_scan(phi_1) | self.is_in_scan(phi_2))
+
+
+def count_sampled_equivalents(hkl, geometries, symmetry_expander, chunk_size=65536):
+    """Number of distinct P1 equivalents (Friedel mates included) of each reflection, and how many of them are sampled
+    by any of the :py:obj:`RotationGeometry` instances"""
+    hkl = np.asarray(hkl).reshape(-1, 3)
+    nsampled = np.empty(hkl.shape[0], dtype=np.int64)
+    nequivalents = np.empty(hkl.shape[0], dtype=np.int64)
+    for start in range(0, hkl.shape[0], chunk_size):
+        keys = np.sort(symmetry_expander.expand_keys(hkl[start:start + chunk_size], friedel=True), axis=1)
+        distinct = np.ones(keys.shape, dtype=bool)
+        distinct[:, 1:] = keys[:, 1:] != keys[:, :-1]
+        equivalent_hkl = np.stack(unpack_hkl(keys.ravel()), axis=1)
+        sampled = np.zeros(equivalent_hkl.shape[0], dtype=bool)
+        for geometry in geometries:
+            sampled |= geometry.is_sampled(equivalent_hkl)
+        nsampled[start:start + chunk_size] = np.count_nonzero(sampled.reshape(keys.shape) & distinct, axis=1)
+        nequivalents[start:start + chunk_size] = np.count_nonzero(distinct, axis=1)
+    return nsampled, nequivalents
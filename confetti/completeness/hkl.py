@@ -0,0 +1,67 @@
+import numpy as np
+
+HKL_BITS = 21
+HKL_OFFSET = 1 << (HKL_BITS - 1)
+HKL_MASK = (1 << HKL_BITS) - 1
+
+
+def pack_hkl(h, k, l):
+    """Pack Miller indices into a single 64-bit integer key
+
+    Each index is shifted by :py:const:`HKL_OFFSET` and stored in :py:const:`HKL_BITS` bits, so indices are
+    bounded to the range [-HKL_OFFSET, HKL_OFFSET).
+    """
+    h = np.asarray(h, dtype=np.int64)
+    k = np.asarray(k, dtype=np.int64)
+    l = np.asarray(l, dtype=np.int64)
+    for index in (h, k, l):
+        if index.size > 0 and (index.min() < -HKL_OFFSET or index.max() >= HKL_OFFSET):
+            raise ValueError('Miller indices out of bounds for packed keys: {}'.format(HKL_OFFSET))
+    return ((h + HKL_OFFSET) << (2 * HKL_BITS)) | ((k + HKL_OFFSET) << HKL_BITS) | (l + HKL_OFFSET)
+
+
+def unpack_hkl(keys):
+    """Recover the h, k, l arrays from keys created with :py:func:`pack_hkl`"""
+    keys = np.asarray(keys, dtype=np.int64)
+    h = ((keys >> (2 * HKL_BITS)) & HKL_MASK) - HKL_OFFSET
+    k = ((keys >> HKL_BITS) & HKL_MASK) - HKL_OFFSET
+    l = (keys & HKL_MASK) - HKL_OFFSET
+    return h, k, l
+
+
+def pack_hkl_array(hkl):
+    """Pack a (N, 3) array of Miller indices"""
+    hkl = np.asarray(hkl).reshape(-1, 3)
+    return pack_hkl(hkl[:, 0], hkl[:, 1], hkl[:, 2])
+
+
+def miller_index_array(indices):
+    """Convert a :py:obj:`cctbx.array_family.flex.miller_index` into a (N, 3) numpy array"""
+    return indices.as_vec3_double().as_numpy_array().astype(np.int64).reshape(-1, 3)
+
+
+def flex_miller_index(hkl):
+    """Convert a (N, 3) numpy array of Miller indices into a :py:obj:`cctbx.array_family.flex.miller_index`
+
+    The indices are handed over as a single contiguous buffer, the inverse of :py:func:`miller_index_array`, so no
+    Python tuples are created. Doubles represent the indices exactly and are rounded back to integers by flex.
+    """
+    from cctbx.array_family import flex
+    hkl = np.ascontiguousarray(np.asarray(hkl).reshape(-1, 3), dtype=np.float64)
+    return flex.miller_index(flex.vec3_double(hkl).iround())
+
+
+def miller_index_keys(indices):
+    """Packed keys for a :py:obj:`cctbx.array_family.flex.miller_index`"""
+    return pack_hkl_array(miller_index_array(indices))
+
+
+def isin_keys(keys, reference_keys):
+    """Vectorized membership test of packed keys using a sorted reference and binary search"""
+    keys = np.asarray(keys, dtype=np.int64)
+    reference_keys = np.unique(np.asarray(reference_keys, dtype=np.int64))
+    if reference_keys.size == 0:
+        return np.zeros(keys.shape, dtype=bool)
+    position = np.searchsorted(reference_keys, keys)
+    position[position == reference_keys.size] = 0
+    return reference_keys[position] == keys
@@ -0,0 +1,261 @@
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from scipy.ndimage import map_coordinates
+from scipy.signal import fftconvolve
+from scipy.spatial import cKDTree
+from scipy.stats import gaussian_kde
+
+
+class BinnedKde(object):
+    """Approximate weighted Gaussian KDE evaluated by linear binning and FFT convolution
+
+    The kernel covariance is taken from :py:obj:`scipy.stats.gaussian_kde`, so the bandwidth rule is the same as for the
+    exact estimator. The weighted points are linearly binned onto a regular grid with spacing ``grid_spacing`` kernel
+    standard deviations along each axis, the grid is convolved with the Gaussian kernel truncated at ``truncate``
+    standard deviations and the result is linearly interpolated back to the query points.
+
+    Both linear binning and linear interpolation are second order in the grid spacing, hence the absolute error against
+    the exact KDE is bounded by ``K(0) * (sum_j delta_j ** 2 * P_jj / 4 + exp(-truncate ** 2 / 2))``, where ``K(0)`` is
+    the peak of the kernel, ``delta_j`` the grid spacing and ``P`` the inverse kernel covariance. This value is
+    available as :py:attr:`error_bound`. With the default spacing of 0.25 standard deviations this amounts to roughly 5%
+    of the kernel peak in 3D, and the observed error is usually well below it since it averages over many points.
+    """
+
+    def __init__(self, dataset, bw_method=None, weights=None, grid_spacing=0.25, truncate=4.0,
+                 max_grid_points=2 ** 24):
+        kde = gaussian_kde(dataset, bw_method=bw_method, weights=weights)
+        self.dataset = kde.dataset
+        self.weights = kde.weights
+        self.d = kde.d
+        self.n = kde.n
+        self.covariance = kde.covariance
+        self.inv_cov = kde.inv_cov
+        self.truncate = truncate
+
+        sigma = np.sqrt(np.diag(self.covariance))
+        lower = self.dataset.min(axis=1) - truncate * sigma
+        upper = self.dataset.max(axis=1) + truncate * sigma
+        spacing = grid_spacing * sigma
+        grid_shape = np.floor((upper - lower) / spacing).astype(np.int64) + 2
+        if np.prod(grid_shape.astype(float)) > max_grid_points:
+            spacing *= (np.prod(grid_shape.astype(float)) / max_grid_points) ** (1.0 / self.d)
+            grid_shape = np.floor((upper - lower) / spacing).astype(np.int64) + 2
+
+        self.spacing = spacing
+        self.origin = lower
+        self.grid_shape = tuple(int(size) for size in grid_shape)
+        self.grid = self._convolve(self._bin())
+
+    @property
+    def kernel_peak(self):
+        return 1.0 / np.sqrt(np.linalg.det(2 * np.pi * self.covariance))
+
+    @property
+    def error_bound(self):
+        discretization = np.sum(self.spacing ** 2 * np.diag(self.inv_cov)) / 4.0
+        return self.kernel_peak * (discretization + np.exp(-self.truncate ** 2 / 2.0))
+
+    def _bin(self):
+        coords = (self.dataset - self.origin[:, None]) / self.spacing[:, None]
+        base = np.floor(coords).astype(np.int64)
+        frac = coords - base
+        grid = np.zeros(int(np.prod(self.grid_shape)))
+        for corner in range(2 ** self.d):
+            offsets = np.array([(corner >> axis) & 1 for axis in range(self.d)])
+            weights = self.weights.copy()
+            for axis in range(self.d):
+                weights *= frac[axis] if offsets[axis] else 1 - frac[axis]
+            flat_idx = np.ravel_multi_index(tuple(base + offsets[:, None]), self.grid_shape)
+            grid += np.bincount(flat_idx, weights=weights, minlength=grid.size)
+        return grid.reshape(self.grid_shape)
+
+    def _convolve(self, grid):
+        half_width = np.ceil(self.truncate * np.sqrt(np.diag(self.covariance)) / self.spacing).astype(np.int64)
+        axes = [np.arange(-width, width + 1) * step for width, step in zip(half_width, self.spacing)]
+        offsets = np.stack(np.meshgrid(*axes, indexing='ij'), axis=-1)
+        mahalanobis = np.einsum('...i,ij,...j->...', offsets, self.inv_cov, offsets)
+        kernel = self.kernel_peak * np.exp(-0.5 * mahalanobis)
+        return np.clip(fftconvolve(grid, kernel, mode='same'), 0, None)
+
+    def evaluate(self, points):
+        points = np.atleast_2d(np.asarray(points, dtype=float))
+        if points.shape[0] != self.d and points.shape[1] == self.d:
+            points = points.T
+        coords = (points - self.origin[:, None]) / self.spacing[:, None]
+        return map_coordinates(self.grid, coords, order=1, mode='constant', cval=0.0)
+
+    __call__ = evaluate
+
+
+_shared_reference = None
+
+
+def _set_shared_reference(reference):
+    global _shared_reference
+    _shared_reference = reference
+
+
+def _evaluate_block(points, reference=None):
+    """Evaluate the unnormalised kernel sum at a block of whitened points, one reference block at a time"""
+    dataset, weights, block_size = _shared_reference if reference is None else reference
+    points_sq = np.einsum('ij,ij->i', points, points)
+    result = np.zeros(points.shape[0])
+    for start in range(0, dataset.shape[0], block_size):
+        ref_block = dataset[start:start + block_size]
+        distances = points_sq[:, None] + np.einsum('ij,ij->i', ref_block, ref_block)[None, :] - \
+            2 * points.dot(ref_block.T)
+        np.maximum(distances, 0, out=distances)
+        np.exp(-0.5 * distances, out=distances)
+        result += distances.dot(weights[start:start + block_size])
+    return result
+
+
+def gaussian_kernel_sum(points, dataset, weights, covariance, block_size=2048):
+    """Sum of weighted Gaussian kernels with a fixed covariance centred at dataset (n, d), evaluated at points (m, d)"""
+    points = np.asarray(points, dtype=float).reshape(-1, covariance.shape[0])
+    dataset = np.asarray(dataset, dtype=float).reshape(-1, covariance.shape[0])
+    if points.shape[0] == 0 or dataset.shape[0] == 0:
+        return np.zeros(points.shape[0])
+
+    center = dataset.mean(axis=0)
+    whitening = np.linalg.cholesky(np.linalg.inv(covariance))
+    reference = ((dataset - center).dot(whitening), np.asarray(weights, dtype=float), block_size)
+    points = (points - center).dot(whitening)
+    result = [_evaluate_block(points[start:start + block_size], reference)
+              for start in range(0, points.shape[0], block_size)]
+    return np.concatenate(result) / np.sqrt(np.linalg.det(2 * np.pi * covariance))
+
+
+class WhitenedKde(gaussian_kde):
+    """Base class for exact KDE evaluators that work on points whitened with the kernel covariance"""
+
+    @property
+    def whitening(self):
+        return np.linalg.cholesky(self.inv_cov)
+
+    @property
+    def norm(self):
+        return np.sqrt(np.linalg.det(2 * np.pi * self.covariance))
+
+    def whiten(self, points):
+        points = np.atleast_2d(np.asarray(points, dtype=float))
+        if points.shape[0] != self.d and points.shape[1] == self.d:
+            points = points.T
+        if points.shape[0] != self.d:
+            raise ValueError('Points have dimension {}, dataset has dimension {}'.format(points.shape[0], self.d))
+
+        center = self.dataset.mean(axis=1)
+        whitening = self.whitening
+        return (self.dataset.T - center).dot(whitening), (points.T - center).dot(whitening)
+
+
+class BlockKde(WhitenedKde):
+    """Exact weighted Gaussian KDE evaluated in blocks of query and reference points across a worker pool
+
+    Peak memory per worker is bounded by ``block_size ** 2`` kernel values and the result matches
+    :py:meth:`scipy.stats.gaussian_kde.evaluate` within floating point tolerance. Use ``executor='process'`` to
+    evaluate the blocks in a process pool instead of a thread pool.
+    """
+
+    def __init__(self, dataset, bw_method=None, weights=None, block_size=2048, nprocs=1, executor='thread'):
+        super(BlockKde, self).__init__(dataset, bw_method=bw_method, weights=weights)
+        if executor not in ('thread', 'process'):
+            raise ValueError('Executor must be either thread or process')
+        self.block_size = block_size
+        self.nprocs = nprocs
+        self.executor = executor
+
+    def evaluate(self, points):
+        dataset, points = self.whiten(points)
+        reference = (dataset, self.weights, self.block_size)
+        blocks = [points[start:start + self.block_size] for start in range(0, points.shape[0], self.block_size)]
+
+        if self.nprocs == 1 or len(blocks) <= 1:
+            result = [_evaluate_block(block, reference) for block in blocks]
+        elif self.executor == 'process':
+            with ProcessPoolExecutor(self.nprocs, initializer=_set_shared_reference,
+                                     initargs=(reference,)) as executor:
+                result = list(executor.map(_evaluate_block, blocks))
+        else:
+            with ThreadPoolExecutor(self.nprocs) as executor:
+                result = list(executor.map(lambda block: _evaluate_block(block, reference), blocks))
+
+        if len(result) == 0:
+            return np.zeros(0)
+        return np.concatenate(result) / self.norm
+
+    __call__ = evaluate
+
+
+class TreeKde(WhitenedKde):
+    """Weighted Gaussian KDE that only sums kernel contributions within a cut-off radius
+
+    The reference points are whitened with the kernel covariance and stored in a :py:obj:`scipy.spatial.cKDTree`, so
+    ``cutoff`` is expressed in multiples of the bandwidth. Each neglected contribution is smaller than
+    ``exp(-cutoff ** 2 / 2)`` times the kernel peak, which is 3.4e-4 for the default cut-off of 4 bandwidths. Query
+    points are processed in blocks of at most ``block_size`` points, shrunk so that a block is expected to hold at
+    most ``max_pairs`` neighbour pairs. The number of neighbours per query is estimated from the densest of
+    ``nsample`` random query points, so this limits memory in practice but is not a hard bound.
+    """
+
+    def __init__(self, dataset, bw_method=None, weights=None, cutoff=4.0, block_size=2048, max_pairs=2 ** 22,
+                 nsample=256):
+        super(TreeKde, self).__init__(dataset, bw_method=bw_method, weights=weights)
+        self.cutoff = cutoff
+        self.block_size = block_size
+        self.max_pairs = max_pairs
+        self.nsample = nsample
+
+    def get_block_size(self, tree, points):
+        """Number of query points per block so that a block is expected to hold at most ``max_pairs`` pairs"""
+        if points.shape[0] == 0:
+            return self.block_size
+        sample = np.random.default_rng(0).choice(points.shape[0], min(self.nsample, points.shape[0]), replace=False)
+        max_neighbours = tree.query_ball_point(points[sample], self.cutoff, return_length=True).max()
+        return int(np.clip(self.max_pairs // max(max_neighbours, 1), 1, self.block_size))
+
+    def evaluate(self, points):
+        dataset, points = self.whiten(points)
+        tree = cKDTree(dataset)
+        block_size = self.get_block_size(tree, points)
+        result = np.zeros(points.shape[0])
+        for start in range(0, points.shape[0], block_size):
+            block = points[start:start + block_size]
+            pairs = cKDTree(block).sparse_distance_matrix(tree, self.cutoff, output_type='ndarray')
+            contributions = np.exp(-0.5 * pairs['v'] ** 2) * self.weights[pairs['j']]
+            result[start:start + block.shape[0]] = np.bincount(pairs['i'], weights=contributions,
+                                                               minlength=block.shape[0])
+        return result / self.norm
+
+    __call__ = evaluate
+
+
+KDE_ENGINES = {
+    'exact': gaussian_kde,
+    'binned': BinnedKde,
+    'block': BlockKde,
+    'tree': TreeKde,
+}
+
+
+def get_kde_engine(mode):
+    """Retrieve the KDE class registered for a given density mode"""
+    if mode not in KDE_ENGINES:
+        raise ValueError('Unknown density mode {}, choose one of: {}'.format(mode, ', '.join(KDE_ENGINES.keys())))
+    return KDE_ENGINES[mode]
+
+
+def get_multiplicity_bw_method(multiplicity, ndim=1):
+    """Scalar bandwidth factor for a KDE of unique points weighted by ``multiplicity`` that reproduces the Scott's rule
+    KDE of the dataset where each point is repeated ``multiplicity`` times
+
+    With weights, :py:obj:`scipy.stats.gaussian_kde` applies Scott's rule to the effective number of points, which is
+    smaller than the number of repeated points, and corrects the weighted covariance for bias by ``1 - sum(w ** 2)``
+    instead of ``1 - 1 / n``. Both are undone here, so any engine fitted with this ``bw_method`` uses the kernel
+    covariance of the repeated dataset.
+    """
+    multiplicity = np.asarray(multiplicity, dtype=float)
+    nrepeated = multiplicity.sum()
+    weights = multiplicity / nrepeated
+    bias_ratio = (1 - np.sum(weights ** 2)) / (1 - 1 / nrepeated)
+    return nrepeated ** (-1.0 / (ndim + 4)) * np.sqrt(bias_ratio)
@@ -0,0 +1,144 @@
+import os
+import logging
+import numpy as np
+import pandas as pd
+from confetti.completeness.hkl import miller_index_keys
+
+
+class MonteCarloIncompleteness(object):
+    """Batched Monte Carlo generator of random incompleteness realizations for a
+    :py:obj:`~confetti.completeness.completeness.Completeness` table
+
+    Each realization deletes a random ``sample`` fraction of the unique reflections. The deletions of all the
+    realizations are drawn at once as a boolean (nrealizations, nunique) matrix, where realization ``i`` is drawn with
+    the generator seeded with ``(seed, i)`` so that every realization can be reproduced on its own. Summary statistics
+    for all the realizations are computed on the existing table without reloading the reflections or recomputing the
+    complete set.
+
+    Only the completeness and the Kolmogorov-Smirnov distances are computed for each realization. The ratios of
+    high density missing reflections and the volume ratio depend on densities and cluster labels that would have to be
+    recomputed for every realization, so they are not reported. The columns are prefixed with ``MC_`` to tell them
+    apart from the complete summary of :py:obj:`~confetti.completeness.completeness.Completeness`. For ASU weighted
+    tables the statistics are weighted by multiplicity and phi and theta are taken from the P1 expansion, as in
+    :py:meth:`~confetti.completeness.completeness.Completeness.compute_summary_statistics`.
+    """
+
+    def __init__(self, completeness, nrealizations=100, sample=0.1, seed=0, chunk_size=16):
+        self.completeness = completeness
+        self.nrealizations = nrealizations
+        self.sample = sample
+        self.seed = seed
+        self.chunk_size = chunk_size
+        self.masks = None
+        self.logger = logging.getLogger(__name__)
+
+    # ------------------ Properties ------------------
+
+    @property
+    def table(self):
+        return self.completeness.table
+
+    @property
+    def unique_rows(self):
+        return np.flatnonzero(self.table['IS_UNIQUE'].values.astype(bool))
+
+    @property
+    def row_unique_position(self):
+        """Position in the mask matrix of the unique reflection each table row is equivalent to"""
+        unique_position = np.full(self.table.shape[0], -1, dtype=np.int64)
+        unique_position[self.unique_rows] = np.arange(self.unique_rows.size)
+        return unique_position[self.table['UNIQUE_ID'].values.astype(np.int64)]
+
+    # ------------------ Methods ------------------
+
+    def draw_masks(self):
+        nunique = self.unique_rows.size
+        ndelete = int(round(nunique * self.sample))
+        self.logger.info('Drawing {} realizations deleting {} reflections each'.format(self.nrealizations, ndelete))
+        self.masks = np.zeros((self.nrealizations, nunique), dtype=bool)
+        for realization in range(self.nrealizations):
+            rng = np.random.default_rng((self.seed, realization))
+            self.masks[realization, rng.permutation(nunique)[:ndelete]] = True
+        return self.masks
+
+    def get_observed(self, realizations):
+        """Return the (len(realizations), nrows) OBSERVED matrix for a set of realizations"""
+        if self.masks is None:
+            self.draw_masks()
+        observed = self.table['OBSERVED'].values.astype(bool)
+        return observed[None, :] & ~self.masks[realizations][:, self.row_unique_position]
+
+    def get_summary_statistics(self):
+        """Return a table with the MC_COMPLETENESS, MC_KSD_r, MC_KSD_phi, MC_KSD_theta and MC_KSD_r_prime values of
+        each realization"""
+        if self.masks is None:
+            self.draw_masks()
+
+        multiplicity = self.completeness.multiplicity
+        sorted_coords = {}
+        for coord in ('r', 'phi', 'theta'):
+            order = self.completeness.get_sort_order(coord)
+            sorted_coords[coord] = (self.table[coord].values[order], order, multiplicity[order])
+        if self.completeness.is_asu_weighted:
+            p1_table, owners = self.completeness.expand_to_p1(self.table)
+            r, theta, phi = self.completeness.compute_spherical_coords(p1_table)
+            for coord, values in (('phi', phi), ('theta', theta)):
+                order = np.argsort(values, kind='stable')
+                sorted_coords[coord] = (values[order], owners[order], None)
+
+        order = self.completeness.get_sort_order('RES')
+        resolution_rows = np.repeat(order, multiplicity[order])
+        resolution = self.table['RES'].values[resolution_rows]
+        cumsum_resolution = np.cumsum(resolution)
+        unique_rows = self.unique_rows
+
+        statistics = []
+        for start in range(0, self.nrealizations, self.chunk_size):
+            realizations = np.arange(start, min(start + self.chunk_size, self.nrealizations))
+            observed = self.get_observed(realizations)
+            chunk = {'REALIZATION': realizations, 'SEED': [(self.seed, idx) for idx in realizations],
+                     'MC_COMPLETENESS': observed[:, unique_rows].mean(axis=1)}
+            for coord, (values, rows, weights) in sorted_coords.items():
+                chunk['MC_KSD_{}'.format(coord)] = self.completeness.get_ks_statistic_masked(
+                    values, observed[:, rows], weights)
+            chunk['MC_KSD_r_prime'] = [
+                self.completeness.get_ks_statistic(cumsum_resolution, np.cumsum(resolution[mask]))
+                for mask in observed[:, resolution_rows]]
+            statistics.append(pd.DataFrame(chunk))
+
+        return pd.concat(statistics, ignore_index=True)
+
+    def get_reflection_unique_position(self):
+        """Position in the mask matrix of the unique reflection each registered reflection belongs to, -1 if none"""
+        unique_rows = self.unique_rows
+        unique_hkl = self.table[['H', 'K', 'L']].values[unique_rows]
+        equivalent_keys = self.completeness.symmetry_expander.expand_keys(unique_hkl, friedel=True)
+        owners = np.repeat(np.arange(unique_rows.size), equivalent_keys.shape[1])
+        equivalent_keys, first = np.unique(equivalent_keys.ravel(), return_index=True)
+        owners = owners[first]
+
+        reflection_keys = miller_index_keys(self.completeness.reflections.data['miller_index'])
+        position = np.searchsorted(equivalent_keys, reflection_keys)
+        position[position == equivalent_keys.size] = 0
+        found = equivalent_keys[position] == reflection_keys
+        return np.where(found, owners[position], -1)
+
+    def write_reflections(self, workdir, fname_template='realization_{}.refl'):
+        from cctbx.array_family import flex
+
+        if self.completeness.reflections is None:
+            self.logger.error('No reflections registered!')
+            return []
+        if self.masks is None:
+            self.draw_masks()
+
+        reflection_position = self.get_reflection_unique_position()
+        found = reflection_position >= 0
+        fnames = []
+        for realization, mask in enumerate(self.masks):
+            to_delete = np.zeros(reflection_position.size, dtype=bool)
+            to_delete[found] = mask[reflection_position[found]]
+            fname = os.path.join(workdir, fname_template.format(realization))
+            self.completeness.reflections.data.select(~flex.bool(to_delete)).as_file(fname)
+            fnames.append(fname)
+        return fnames
@@ -0,0 +1,64 @@
+import logging
+import numpy as np
+from cached_property import cached_property
+from confetti.completeness.geometry import RotationGeometry, count_sampled_equivalents
+from confetti.completeness.symmetry import SymmetryExpander
+from confetti.completeness.hkl import miller_index_array
+
+
+class CompletenessPredictor(object):
+    """Completeness expected from a set of rotation sweeps, predicted from their geometry alone
+
+    The unique reflections up to ``d_min`` are generated for the symmetry of the first experiment and each of them is
+    expanded into its P1 equivalents. A unique reflection is predicted as measured if any of its equivalents is
+    rotated through the Ewald sphere by any of the sweeps, see
+    :py:obj:`~confetti.completeness.geometry.RotationGeometry`. Nothing is integrated or scaled, so this is an
+    upper bound that ignores detector gaps, overloads and rejected reflections.
+    """
+
+    def __init__(self, experiments, d_min, chunk_size=65536):
+        self.experiments = experiments
+        self.d_min = d_min
+        self.chunk_size = chunk_size
+        self.logger = logging.getLogger(__name__)
+
+    # ------------------ Properties ------------------
+
+    @cached_property
+    def geometries(self):
+        geometries = [RotationGeometry.from_experiment(experiment) for experiment in self.experiments]
+        return [geometry for geometry in geometries if geometry is not None]
+
+    @cached_property
+    def unique_hkl(self):
+        from cctbx import miller
+        crystal_symmetry = self.experiments[0].crystal.get_crystal_symmetry()
+        complete_set = miller.build_set(crystal_symmetry, anomalous_flag=False, d_min=self.d_min)
+        return miller_index_array(complete_set.indices())
+
+    @cached_property
+    def symmetry_expander(self):
+        return SymmetryExpander.from_space_group(self.experiments[0].crystal.get_space_group())
+
+    @cached_property
+    def sampled_equivalents(self):
+        return count_sampled_equivalents(self.unique_hkl, self.geometries, self.symmetry_expander, self.chunk_size)
+
+    @property
+    def completeness(self):
+        nsampled, nequivalents = self.sampled_equivalents
+        if nsampled.size == 0:
+            return 0.0
+        return np.count_nonzero(nsampled) / nsampled.size
+
+    @property
+    def p1_sampled_fraction(self):
+        """Fraction of the P1 reflections within ``d_min`` that are swept through the Ewald sphere"""
+        nsampled, nequivalents = self.sampled_equivalents
+        if nsampled.size == 0:
+            return 0.0
+        return nsampled.sum() / nequivalents.sum()
+
+    @property
+    def summary(self):
+        return self.completeness, self.p1_sampled_fraction, self.unique_hkl.shape[0], len(self.geometries)
@@ -0,0 +1,51 @@
+import numpy as np
+
+COMPACT_SCHEMA = {
+    'H': 'int16',
+    'K': 'int16',
+    'L': 'int16',
+    'A': 'float32',
+    'B': 'float32',
+    'C': 'float32',
+    'RES': 'float32',
+    'r': 'float32',
+    'phi': 'float32',
+    'theta': 'float32',
+    'RES_DENSITY': 'float32',
+    'RES_CUMSUM': 'float32',
+    'WEIGHTED_DENSITY': 'float32',
+    'NORM_WEIGHTED_DENSITY': 'float32',
+    'OBSERVED': 'bool',
+    'IS_UNIQUE': 'bool',
+    'IS_BIJVOET': 'bool',
+    'IS_CENTRIC': 'bool',
+    'IS_SAMPLED': 'bool',
+    'HKL_KEY': 'int64',
+    'UNIQUE_ID': 'int32',
+    'MULTIPLICITY': 'int16',
+    'MEANSHIFT_LABELS': 'category',
+}
+
+SUMMARY_COLUMNS = ['A', 'B', 'C', 'RES', 'r', 'phi', 'theta', 'OBSERVED', 'IS_UNIQUE', 'NORM_WEIGHTED_DENSITY',
+                   'MEANSHIFT_LABELS']
+ASU_SUMMARY_COLUMNS = SUMMARY_COLUMNS + ['H', 'K', 'L', 'MULTIPLICITY']
+TABLE_FORMATS = ('csv', 'parquet', 'feather', 'npy')
+SUMMARY_FIELDS = ('IS_P1', 'SYMMETRY_LEVEL', 'SCALED_REFL', 'SCALED_EXPT', 'KSD_r', 'KSD_phi', 'KSD_theta',
+                  'KSD_r_prime', 'R_RFLmissing_0.3', 'R_RFLmissing_0.6', 'R_RFLmissing_0.9', 'R_VOLUME')
+SUMMARY_SIDECAR_FNAME = 'completeness_summary.json'
+TABLE_METADATA_SUFFIX = '.meta.json'
+
+
+def apply_compact_schema(df):
+    """Cast the columns of a completeness table to :py:const:`COMPACT_SCHEMA` in place, returns the bytes saved"""
+    memory_before = df.memory_usage(deep=True).sum()
+    for column, dtype in COMPACT_SCHEMA.items():
+        if column not in df.columns or df[column].dtype == dtype:
+            continue
+        if dtype == 'bool' and df[column].dtype == object:
+            df[column] = df[column].astype(str).str.lower() == 'true'
+        elif dtype.startswith('int') and df[column].abs().max() > np.iinfo(dtype).max:
+            continue
+        else:
+            df[column] = df[column].astype(dtype)
+    return memory_before - df.memory_usage(deep=True).sum()
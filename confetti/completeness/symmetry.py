@@ -0,0 +1,61 @@
+import numpy as np
+from confetti.completeness.hkl import pack_hkl_array
+
+
+class SymmetryExpander(object):
+    """Expand Miller indices to their symmetry equivalents and Friedel mates with batched integer products
+
+    The rotation parts of the space group operators are cached as a (n_ops, 3, 3) integer array, so that the
+    equivalents of every index are obtained with a single matrix product ``h * R`` instead of one call to
+    :py:func:`cctbx.miller.sym_equiv_indices` per reflection.
+    """
+
+    def __init__(self, rotations, chunk_size=65536):
+        self.rotations = np.unique(np.asarray(rotations, dtype=np.int64).reshape(-1, 3, 3), axis=0)
+        self.chunk_size = chunk_size
+
+    # ------------------ Class methods ------------------
+
+    @classmethod
+    def from_space_group(cls, space_group, **kwargs):
+        rotations = []
+        for op in space_group.all_ops():
+            rotation = op.r()
+            rotations.append(np.array(rotation.num(), dtype=np.int64).reshape(3, 3) // rotation.den())
+        return cls(rotations, **kwargs)
+
+    @classmethod
+    def from_gemmi_ops(cls, group_ops, **kwargs):
+        """Create the expander from a :py:obj:`gemmi.GroupOps`, such as ``gemmi.SpaceGroup.operations()``"""
+        rotations = [np.array(op.rot, dtype=np.int64) // op.DEN for op in group_ops]
+        return cls(rotations, **kwargs)
+
+    # ------------------ Properties ------------------
+
+    @property
+    def order(self):
+        return self.rotations.shape[0]
+
+    # ------------------ Methods ------------------
+
+    def expand(self, hkl, friedel=True):
+        """Return a (N, n_ops, 3) array with the equivalents of each index, (N, 2 * n_ops, 3) with Friedel mates"""
+        hkl = np.asarray(hkl, dtype=np.int64).reshape(-1, 3)
+        equivalents = np.einsum('ni,oij->noj', hkl, self.rotations)
+        if friedel:
+            equivalents = np.concatenate((equivalents, -equivalents), axis=1)
+        return equivalents
+
+    def expand_keys(self, hkl, friedel=True):
+        """Return a (N, n_equivalents) array with the packed keys of the equivalents of each index"""
+        equivalents = self.expand(hkl, friedel)
+        return pack_hkl_array(equivalents).reshape(equivalents.shape[0], equivalents.shape[1])
+
+    def equivalent_keys(self, hkl, friedel=True):
+        """Sorted unique packed keys of all the symmetry equivalents of a set of indices"""
+        hkl = np.asarray(hkl, dtype=np.int64).reshape(-1, 3)
+        keys = [np.unique(self.expand_keys(hkl[start:start + self.chunk_size], friedel))
+                for start in range(0, hkl.shape[0], self.chunk_size)]
+        if len(keys) == 0:
+            return np.zeros(0, dtype=np.int64)
+        return np.unique(np.concatenate(keys))
@@ -4,6 +4,7 @@ import pickle
 from pyjob import TaskFactory
 import logging
 from confetti.completeness import CompletenessArray
+from confetti.completeness.schema import SUMMARY_FIELDS
 from confetti.processing import SweepArray, ClusterArray
 from confetti.mr import MrArray
 
@@ -146,7 +147,8 @@ class Dataset(object):
                                       'DELTA_CCHALF_MEAN', 'CCHALF_STD', 'SCALE_N_DELETED_DATASETS', 'RPIM', 'RMEAS',
                                       'RMERGE', 'CCHALF', 'I/SIGMA', 'MULTIPLICITY', 'COMPLETENESS', 'RESOLUTION_LOW',
                                       'RESOLUTION_HIGH', 'COMPLETENESS_LOW', 'COMPLETENESS_HIGH', 'SPACE_GROUP',
-                                      'CONNECTED_REFLECTIONS', 'EXPT_IDS', 'SWEEPS']
+                                      'CONNECTED_REFLECTIONS', 'PREDICTED_COMPLETENESS', 'EXPT_IDS',
+                                      'SWEEPS']
 
     def create_mr_table(self):
         table = []
@@ -167,9 +169,7 @@ class Dataset(object):
             table.append((self.id, dataset.id, *dataset.summary))
 
         self.completeness_table = pd.DataFrame(table)
-        self.completeness_table.columns = ['DATASET', 'TABLE_ID', 'IS_P1', 'SYMMETRY_LEVEL', 'SCALED_REFL',
-                                           'SCALED_EXPT', 'KSD_r', 'KSD_phi', 'KSD_theta', 'KSD_r_prime',
-                                           'R_RFLmissing_0.3', 'R_RFLmissing_0.6', 'R_RFLmissing_0.9', 'R_VOLUME']
+        self.completeness_table.columns = ['DATASET', 'TABLE_ID', *SUMMARY_FIELDS]
 
     def retrieve_unique_mtzs(self):
         mtz_list = []
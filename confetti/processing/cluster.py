@@ -2,11 +2,13 @@ import os
 import logging
 import confetti.wrappers
 from cached_property import cached_property
+from confetti.io import Experiments
+from confetti.completeness import CompletenessPredictor
 
 
 class Cluster(object):
 
-    def __init__(self, id, workdir, sweeps_dir, clustering_threshold=5000, nprocs=1):
+    def __init__(self, id, workdir, sweeps_dir, clustering_threshold=5000, nprocs=1, completeness_floor=None):
         self.id = id
         self.workdir = os.path.join(workdir, 'cluster_{}'.format(id))
         self.error = False
@@ -20,6 +22,8 @@ class Cluster(object):
         self.scaling_stats = ['NA', 'NA', 'NA', 'NA']
         self.merging_stats = ['NA', 'NA', 'NA', 'NA', 'NA', 'NA', 'NA', 'NA', 'NA', 'NA', 'NA', 'NA']
         self.exclude_sweeps = []
+        self.completeness_floor = completeness_floor
+        self.predicted_completeness = 'NA'
 
     # ------------------ General properties ------------------
 
@@ -35,11 +39,15 @@ class Cluster(object):
     def scaled_expt(self):
         return os.path.join(self.workdir, 'scaled.expt')
 
+    @property
+    def symmetrized_expt(self):
+        return os.path.join(self.workdir, 'symmetrized.expt')
+
     @property
     def summary(self):
         return (self.id, self.clustering_threshold, self.workdir, self.hklout, self.scaled_refl, self.scaled_expt,
                 *self.scaling_stats, *self.merging_stats, self.connected_missing_reflections,
-                tuple(sorted(self.experiments_identifiers)))
+                getattr(self, 'predicted_completeness', 'NA'), tuple(sorted(self.experiments_identifiers)))
 
     @cached_property
     def input_fnames(self):
@@ -90,6 +98,14 @@ class Cluster(object):
             return
 
         self.resolution = dials_resolution.resolution
+        if self.completeness_floor is not None and self.resolution is not None:
+            self.predicted_completeness = self.predict_completeness()
+            if self.predicted_completeness < self.completeness_floor:
+                self.logger.warning('Cluster_{} predicted completeness {:.3f} is below {}, skipping'.format(
+                    self.id, self.predicted_completeness, self.completeness_floor))
+                self.error = True
+                return
+
         dials_scale = self.scale()
         if dials_scale.error:
             self.logger.error('Cluster_{} failed to scale'.format(self.id))
@@ -129,6 +145,12 @@ class Cluster(object):
             return
         self.connected_missing_reflections = dials_missing_reflections.connected_reflections_percentage
 
+    def predict_completeness(self):
+        experiments = Experiments(self.symmetrized_expt)
+        predictor = CompletenessPredictor(experiments.data, self.resolution)
+        self.logger.info('Cluster_{} predicted completeness: {:.3f}'.format(self.id, predictor.completeness))
+        return predictor.completeness
+
     def scale(self):
         dials_scale = confetti.wrappers.DialsScale(self.workdir, self.resolution, self.nprocs)
         dials_scale.run()
@@ -8,7 +8,7 @@ from confetti.processing import ClusterSequence
 class ClusterArray(object):
 
     def __init__(self, workdir, sweeps_dir, cluster_thresholds, platform="sge", queue_name=None, queue_environment=None,
-                 max_concurrent_nprocs=1, cleanup=False, dials_exe='dials'):
+                 max_concurrent_nprocs=1, cleanup=False, dials_exe='dials', completeness_floor=None):
         self.sweeps_dir = sweeps_dir
         self.workdir = os.path.join(workdir, 'clusters')
         self.pickle_fname = os.path.join(self.workdir, 'clusterarray.pckl')
@@ -22,6 +22,7 @@ class ClusterArray(object):
         self.shell_interpreter = "/bin/bash"
         self.cleanup = cleanup
         self.cluster_thresholds = cluster_thresholds
+        self.completeness_floor = completeness_floor
         self.logger = logging.getLogger(__name__)
 
     # ------------------ Class methods ------------------
@@ -79,8 +80,9 @@ class ClusterArray(object):
         self.make_workdir()
 
         for idx, cluster_threshold in enumerate(self.cluster_thresholds, 1):
-            cluster_sequence = ClusterSequence(idx, self.workdir,
-                                               self.sweeps_dir, clustering_threshold=cluster_threshold)
+            cluster_sequence = ClusterSequence(idx, self.workdir, self.sweeps_dir,
+                                               clustering_threshold=cluster_threshold,
+                                               completeness_floor=self.completeness_floor)
             cluster_sequence.dials_exe = self.dials_exe
             cluster_sequence.dump_pickle()
 
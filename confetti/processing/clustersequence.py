@@ -9,7 +9,7 @@ from confetti.io import Experiments
 
 class ClusterSequence(object):
 
-    def __init__(self, id, workdir, sweeps_dir, nprocs=1, clustering_threshold=5000):
+    def __init__(self, id, workdir, sweeps_dir, nprocs=1, clustering_threshold=5000, completeness_floor=None):
         self.id = id
         self.sweeps_dir = sweeps_dir
         self.workdir = os.path.join(workdir, 'cluster_sequence_{}'.format(id))
@@ -18,6 +18,7 @@ class ClusterSequence(object):
         self.pickle_fname = os.path.join(self.workdir, 'clustersequence.pckl')
         self.nprocs = nprocs
         self.clustering_threshold = clustering_threshold
+        self.completeness_floor = completeness_floor
         self.exclude_sweeps = []
         self.shell_interpreter = "/bin/bash"
         self.logger = logging.getLogger(__name__)
@@ -81,7 +82,8 @@ EOF""".format(**self.__dict__)
 
         while not solved:
 
-            cluster = Cluster(idx, self.workdir, self.sweeps_dir, self.clustering_threshold, self.nprocs)
+            cluster = Cluster(idx, self.workdir, self.sweeps_dir, self.clustering_threshold, self.nprocs,
+                              self.completeness_floor)
             cluster.exclude_sweeps = self.exclude_sweeps
             self.logger.info('Processing Cluster_{}'.format(idx))
             cluster.process()
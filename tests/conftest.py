@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+from confetti.completeness.symmetry import SymmetryExpander
+from confetti.completeness.hkl import pack_hkl_array, isin_keys
+
+P222_ROTATIONS = [np.diag(diagonal) for diagonal in ((1, 1, 1), (1, -1, -1), (-1, 1, -1), (-1, -1, 1))]
+
+
+def get_lattice_hkl(fractionalization_matrix, d_min):
+    """All the Miller indices except the origin with a d-spacing of at least ``d_min``"""
+    limits = np.ceil(np.linalg.norm(np.linalg.inv(fractionalization_matrix), axis=1) / d_min).astype(int)
+    grid = np.stack(np.meshgrid(*[np.arange(-limit, limit + 1) for limit in limits], indexing='ij'), axis=-1)
+    hkl = grid.reshape(-1, 3)
+    norm = np.linalg.norm(hkl.dot(fractionalization_matrix), axis=1)
+    return hkl[(norm > 0) & (norm <= 1 / d_min)]
+
+
+def make_completeness(hkl, fractionalization_matrix, observed, multiplicity=None, centric=None, seed=0):
+    from confetti.completeness.completeness import Completeness
+
+    abc = hkl.dot(fractionalization_matrix)
+    df = Completeness.get_table_columns(hkl, abc, 1 / np.linalg.norm(abc, axis=1), observed, pack_hkl_array(hkl),
+                                        multiplicity, centric)
+    r, theta, phi = Completeness.compute_spherical_coords(df)
+    df['r'] = r
+    df['phi'] = phi
+    df['theta'] = theta
+    df['NORM_WEIGHTED_DENSITY'] = np.random.default_rng(seed).uniform(size=df.shape[0])
+    df['MEANSHIFT_LABELS'] = np.nan
+    completeness = Completeness()
+    completeness.table = df
+    completeness.is_asu_weighted = multiplicity is not None
+    completeness.is_p1 = not completeness.is_asu_weighted
+    completeness.fractionalization_matrix = fractionalization_matrix
+    return completeness
+
+
+@pytest.fixture
+def p1_and_asu_tables():
+    """The same incomplete P222 dataset as a P1 expanded table and as an ASU weighted table
+
+    Each unique reflection is represented by the equivalent with the largest packed key and whole orbits are
+    observed or missing together.
+    """
+    fractionalization_matrix = np.diag([1 / 40., 1 / 50., 1 / 60.])
+    expander = SymmetryExpander(P222_ROTATIONS)
+    p1_hkl = get_lattice_hkl(fractionalization_matrix, 5.0)
+
+    orbit_keys = np.sort(expander.expand_keys(p1_hkl, friedel=True), axis=1)
+    representative = orbit_keys[:, -1]
+    asu_rows = np.flatnonzero(pack_hkl_array(p1_hkl) == representative)
+    asu_hkl = p1_hkl[asu_rows]
+    asu_orbits = orbit_keys[asu_rows]
+    multiplicity = 1 + np.count_nonzero(asu_orbits[:, 1:] != asu_orbits[:, :-1], axis=1)
+    centric = np.any(expander.expand_keys(asu_hkl, friedel=False) == pack_hkl_array(-asu_hkl)[:, None], axis=1)
+
+    rng = np.random.default_rng(0)
+    asu_observed = rng.uniform(size=asu_hkl.shape[0]) > 0.3
+    p1_observed = isin_keys(representative, pack_hkl_array(asu_hkl[asu_observed]))
+
+    p1 = make_completeness(p1_hkl, fractionalization_matrix, p1_observed)
+    asu = make_completeness(asu_hkl, fractionalization_matrix, asu_observed, multiplicity, centric)
+    for completeness in (p1, asu):
+        completeness.symmetry_expander = expander
+    return p1, asu
+
+
+@pytest.fixture
+def anisotropic_p1_table():
+    """Fully observed P1 table of a 20 x 20 x 200 A cell, whose reciprocal cell is ten times shorter along c"""
+    fractionalization_matrix = np.diag([1 / 20., 1 / 20., 1 / 200.])
+    hkl = get_lattice_hkl(fractionalization_matrix, 2.0)
+    return make_completeness(hkl, fractionalization_matrix, np.ones(hkl.shape[0], dtype=bool))
@@ -0,0 +1,51 @@
+import pytest
+
+pytest.importorskip('cached_property')
+
+import confetti.wrappers
+from confetti.processing.cluster import Cluster
+
+
+class FakeCosym(object):
+    def __init__(self, *args, **kwargs):
+        self.error = False
+        self.cluster_experiment_identifiers = ['0', '1', '2']
+
+    def run(self):
+        pass
+
+
+class FakeEstimateResolution(object):
+    def __init__(self, *args, **kwargs):
+        self.error = False
+        self.resolution = 2.0
+
+    def run(self):
+        pass
+
+
+def fail_if_called(*args, **kwargs):
+    raise AssertionError('The cluster should have been skipped before this step')
+
+
+@pytest.fixture
+def cluster(tmp_path, monkeypatch):
+    monkeypatch.setattr(confetti.wrappers, 'DialsCosym', FakeCosym)
+    monkeypatch.setattr(confetti.wrappers, 'DialsEstimateResolution', FakeEstimateResolution)
+    for wrapper in ('DialsScale', 'DialsMerge', 'FreeRFlag', 'DialsMissingReflections'):
+        monkeypatch.setattr(confetti.wrappers, wrapper, fail_if_called)
+    monkeypatch.setattr(Cluster, 'predict_completeness', lambda self: 0.4)
+    monkeypatch.chdir(tmp_path)
+    return Cluster(1, str(tmp_path), str(tmp_path), completeness_floor=0.8)
+
+
+def test_process_skips_cluster_below_completeness_floor(cluster):
+    cluster.process()
+    assert cluster.error
+    assert cluster.predicted_completeness == 0.4
+    assert cluster.scaling_stats == ['NA'] * 4
+
+
+def test_summary_of_clusters_pickled_without_predicted_completeness(cluster):
+    del cluster.predicted_completeness
+    assert cluster.summary[-2] == 'NA'
@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('pyjob')
+pytest.importorskip('cached_property')
+
+
+@pytest.mark.parametrize('mode', ['exact', 'binned'])
+def test_asu_res_density_matches_p1(p1_and_asu_tables, mode):
+    p1, asu = p1_and_asu_tables
+    p1.get_res_density(mode)
+    asu.get_res_density(mode)
+
+    rows = p1.get_rows(asu.get_hkl_keys())
+    assert rows.size == asu.table.shape[0]
+    np.testing.assert_allclose(asu.table['RES_DENSITY'].values, p1.table['RES_DENSITY'].values[rows], rtol=1e-8)
+
+
+def test_default_voxel_size_leaves_no_empty_voxels(anisotropic_p1_table):
+    completeness = anisotropic_p1_table
+    voxel_size = completeness.default_voxel_size
+    points = completeness.table[['A', 'B', 'C']].values
+    occupied = completeness.get_voxel_keys(points, voxel_size)
+
+    radius = np.linalg.norm(points, axis=1).max()
+    limit = int(np.ceil(radius / voxel_size))
+    grid = np.stack(np.meshgrid(*[np.arange(-limit, limit + 1)] * 3, indexing='ij'), axis=-1).reshape(-1, 3)
+    inside = np.linalg.norm(grid * voxel_size, axis=1) + np.sqrt(3) / 2 * voxel_size <= radius
+    assert np.count_nonzero(inside) > 0
+    assert np.all(np.isin(completeness.get_voxel_keys(grid[inside] * voxel_size, voxel_size), occupied))
@@ -0,0 +1,18 @@
+import numpy as np
+import pytest
+from scipy.spatial import cKDTree
+from scipy.stats import gaussian_kde
+from confetti.completeness.kde import TreeKde
+
+
+@pytest.mark.parametrize('block_size, max_pairs', [(64, 2 ** 22), (2048, 5000)], ids=['block_size', 'max_pairs'])
+def test_tree_kde_matches_gaussian_kde_across_blocks(block_size, max_pairs):
+    rng = np.random.default_rng(0)
+    dataset = rng.normal(size=(3, 500))
+    weights = rng.uniform(0.5, 2.0, size=500)
+    points = rng.normal(size=(3, 300))
+
+    kde = TreeKde(dataset, weights=weights, cutoff=8.0, block_size=block_size, max_pairs=max_pairs)
+    whitened_dataset, whitened_points = kde.whiten(points)
+    assert kde.get_block_size(cKDTree(whitened_dataset), whitened_points) < points.shape[1]
+    np.testing.assert_allclose(kde(points), gaussian_kde(dataset, weights=weights)(points), rtol=1e-10)
@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+from confetti.completeness.ablation import AblationSeries
+from confetti.completeness.montecarlo import MonteCarloIncompleteness
+
+pytest.importorskip('pyjob')
+pytest.importorskip('cached_property')
+
+
+@pytest.mark.parametrize('table_idx', [0, 1], ids=['p1', 'asu'])
+def test_summary_statistics_match_completeness(p1_and_asu_tables, table_idx):
+    completeness = p1_and_asu_tables[table_idx]
+    completeness.get_unique_reflections()
+    montecarlo = MonteCarloIncompleteness(completeness, nrealizations=3, sample=0.2, seed=1)
+    statistics = montecarlo.get_summary_statistics()
+    observed = montecarlo.get_observed(np.arange(montecarlo.nrealizations))
+
+    for realization in range(montecarlo.nrealizations):
+        completeness.table['OBSERVED'] = observed[realization]
+        completeness.invalidate_cache()
+        expected = completeness.compute_summary_statistics()
+        for coord in ('r', 'phi', 'theta', 'r_prime'):
+            np.testing.assert_allclose(statistics['MC_KSD_{}'.format(coord)][realization],
+                                       expected['ksd_{}'.format(coord)])
+
+
+def test_ablation_rejects_asu_tables(p1_and_asu_tables):
+    with pytest.raises(ValueError):
+        AblationSeries(p1_and_asu_tables[1])
@@ -0,0 +1,34 @@
+import sys
+import importlib.util
+import numpy as np
+import pytest
+from confetti.analysis.results import Results
+
+pytest.importorskip('pyjob')
+pytest.importorskip('cached_property')
+
+SCRIPT = """dials.python << EOF
+from confetti.completeness import Completeness
+completeness = Completeness().from_raw_data('{experiments_fname}', '{reflections_fname}', False, True)
+EOF
+"""
+
+
+def test_fallback_summary_reads_space_group_from_table_metadata(p1_and_asu_tables, tmp_path, monkeypatch):
+    if importlib.util.find_spec('cctbx') is None:
+        pytest.importorskip('gemmi')
+    completeness = p1_and_asu_tables[1]
+    completeness.get_unique_reflections()
+    completeness.space_group_hall = ' P 2 2'
+    completeness.experiments_fname = str(tmp_path / 'scaled.expt')
+    completeness.reflections_fname = str(tmp_path / 'scaled.refl')
+    completeness.save_table(str(tmp_path / 'completeness.csv'))
+    with open(str(tmp_path / 'completeness_table_1.sh'), 'w') as fhandle:
+        fhandle.write(SCRIPT.format(**completeness.__dict__))
+
+    monkeypatch.setitem(sys.modules, 'confetti.io.experiments_parser', None)
+    summary = Results().load_completeness_summary(str(tmp_path), '1')
+
+    assert summary[:4] == (False, completeness.symmetry_level, completeness.reflections_fname,
+                           completeness.experiments_fname)
+    np.testing.assert_allclose(summary[4:], completeness.summary[4:])